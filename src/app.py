@@ -2,20 +2,27 @@ import re
 import streamlit as st
 import plotly.express as px
 import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# Before the local imports, which read their settings (LLM_FAKE, CHUNK_CODEC, ...) at import time
+load_dotenv(Path(__file__).parent.parent / "config" / ".env")
+
 from ingestion import LectureNotesIngester, LectureDB
-from quiz_generator import generate_quiz
-from database import init_db, log_quiz_result, get_student_progress, get_weak_topics
+from quiz_generator import stream_quiz, generate_quiz_parallel
+from database import init_db, get_student_progress, get_student_summary, get_weak_topics, get_data_version, last_llm_call_id
+from result_writer import get_result_writer
+from quiz_bank import get_quiz_bank
+from question_dedup import filter_new_questions, find_new_questions, record_questions
+from downsample import downsample_progress, CHART_POINT_BUDGET
 import pandas as pd
 import sqlite3
-from sklearn.feature_extraction.text import TfidfVectorizer
 import json
 import uuid
-from datetime import datetime
+from datetime import datetime, timedelta
 import time
-from langchain_openai import ChatOpenAI  # Update import
-from openai import OpenAI  
-from pathlib import Path
-from dotenv import load_dotenv
+from llm_client import get_chat_model
+import llm_telemetry
 from reportlab.lib import colors
 from reportlab.lib.pagesizes import letter
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer
@@ -35,8 +42,9 @@ st.set_page_config(
     initial_sidebar_state="expanded",
     menu_items=None
 )
-from sklearn.feature_extraction.text import TfidfVectorizer
 from ingestion import TagDB
+from storage import VectorStoreManager
+from bundle import export_bundle, import_bundle
 import io
 import zipfile
 import json
@@ -63,28 +71,30 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 
-def get_key_chunks(chunks):
-    vectorizer = TfidfVectorizer()
-    tfidf = vectorizer.fit_transform(chunks)
-    scores = tfidf.sum(axis=1).A1
-    
-    return [chunks[i] for i in scores.argsort()[-5:]]
-
-
 init_db()
 tag_db = TagDB()
 lecture_db = LectureDB()
+store_manager = VectorStoreManager(lecture_db)
 
 st.title("StudyBuddy 🧠")
 
 # ===== Sidebar =====
 st.sidebar.header("Quick Access")
 
+student_id = st.sidebar.number_input(
+    "🎓 Student ID",
+    min_value=1,
+    value=1,
+    step=1,
+    key="student_id",
+    help="Quiz results and progress are recorded per student"
+)
+
 # Version-aware lecture loader
 @st.cache_data(show_spinner=False, ttl=60)
 def load_sidebar_lectures(_lecture_db, cache_version):
     try:
-        lectures = _lecture_db.get_all_lectures()
+        lectures = _lecture_db.list_lectures()
         if not lectures:
             st.warning("No lectures found in database")
             return []
@@ -109,7 +119,7 @@ try:
         selected_lecture = st.sidebar.selectbox(
             "📚 Select Note for Quiz:",
             options=sidebar_lectures,
-            format_func=lambda x: f"{x['title']} ({len(x['chunks'])} chunks)",
+            format_func=lambda x: f"{x['title']} ({x['chunk_count']} chunks)",
             index=0 if sidebar_lectures else None,
             help="Choose a note to start a quiz"
         )
@@ -326,9 +336,10 @@ Remember, your primary goal is to enhance understanding through clear explanatio
     "[View the source code](https://github.com/)"
     "[![Streamlit App](https://static.streamlit.io/badges/streamlit_badge_black_white.svg)](https://nekonardo-studybuddy-srcapp-fjgveg.streamlit.app/)"
     
-client = ChatOpenAI(
+# Shared across reruns; reuses pooled connections
+client = get_chat_model(
     api_key=openai_api_key,
-    model_name=model,
+    model=model,
     temperature=0.3
 )
 # client = ChatOpenAI(
@@ -338,11 +349,6 @@ client = ChatOpenAI(
 #     temperature=0.3
 # )
 
-# Modify the cache function to include the title as a parameter.
-@st.cache_data(ttl=3600)
-def get_cached_quiz(chunk, lecture_id, title):
-    return generate_quiz(chunk)
-
 def main():
 
     if 'quiz' not in st.session_state:
@@ -376,8 +382,7 @@ with tab1:
             new_tag = st.text_input("Create New Tag", help="Enter a new tag and click Add")
             if st.button("➕ Add Tag"):
                 if new_tag and (clean_tag := new_tag.strip()) and clean_tag not in st.session_state.available_tags:
-                    st.session_state.available_tags.append(clean_tag)
-                    tag_db.save_tags(st.session_state.available_tags)  # Save to file
+                    st.session_state.available_tags = tag_db.add_tag(clean_tag)  # Save to file
         
         with col2:
             if st.session_state.available_tags:
@@ -387,8 +392,7 @@ with tab1:
                     help="Select tag to remove from available options"
                 )
                 if st.button("🗑️ Remove Tag"):
-                    st.session_state.available_tags.remove(tag_to_remove)
-                    tag_db.save_tags(st.session_state.available_tags)  # Save to file
+                    st.session_state.available_tags = tag_db.remove_tag(tag_to_remove)  # Save to file
         
         # Tag selection
         tags = st.multiselect(
@@ -412,13 +416,19 @@ with tab1:
                 
                 rag.save(vector_store_path)
                 
-                lecture_db.save_lecture(
+                lecture_id = lecture_db.save_lecture(
                     title=title,
                     file_name=uploaded_file.name,
                     chunks=chunks,
                     tags=tags,
                     vector_store_path=vector_store_path  
                 )
+                # Start pre-generating quizzes so the first one is ready when asked for
+                get_quiz_bank().request_fill(
+                    lecture_id,
+                    lecture_db.key_chunks(lecture_id),
+                    api_key=st.session_state.get("chatbot_api_key")
+                )
                 
                 st.session_state.lecture_cache_version += 1
                 st.success("Lecture saved successfully!")
@@ -437,7 +447,6 @@ with tab2:
     if selected_lecture:
         header_name = f"Selected Note: {selected_lecture['title']}"
         st.subheader(header_name)
-        chunks = selected_lecture["chunks"]
         
         # Session state initialization
         if 'quiz' not in st.session_state:
@@ -448,39 +457,120 @@ with tab2:
             st.session_state.submitted = False
 
         # Quiz generation
+        col1, col2 = st.columns(2)
+        with col1:
+            generation_mode = st.radio(
+                "Generation mode",
+                ["Streaming", "Parallel per chunk"],
+                horizontal=True,
+                help="Parallel sends one smaller request per selected chunk at once, "
+                     "covering all of them instead of the first 3000 characters"
+            )
+        with col2:
+            force_fresh = st.checkbox(
+                "Force fresh quiz",
+                help="Always ask the model for a new quiz instead of reusing a cached or pre-generated one"
+            )
+        # Questions per quiz, and the fewest unseen ones accepted before topping up
+        QUIZ_LENGTH = 5
+        MIN_NEW_QUESTIONS = 3
         if st.button("Generate New Quiz"):
             try:
-                key_chunks = get_key_chunks(chunks)
-                quiz_data = generate_quiz(
-                    "\n".join(key_chunks),
-                    api_key=st.session_state.get("chatbot_api_key")  
-                )
-                
-                # Process LaTeX in quiz data
-                # if isinstance(quiz_data, dict) and 'questions' in quiz_data:
-                #     for question in quiz_data['questions']:
-                #         # Fix LaTeX in question text
-                #         if 'question' in question:
-                #             question['question'] = question['question'].replace('rac{', '\\frac{').replace('imes{', '\\times{').replace('ext{', '\\text{')
-                        
-                #         # Fix LaTeX in options
-                #         if 'options' in question:
-                #             question['options'] = [
-                #                 opt.replace('rac{', '\\frac{')
-                #                 .replace('imes{', '\\times{')
-                #                 .replace('ext{', '\\text{')
-                #                 for opt in question['options']
-                #             ]
-                        
-                #         # Fix LaTeX in explanation
-                #         if 'explanation' in question:
-                #             question['explanation'] = question['explanation'].replace('rac{', '\\frac{').replace('imes{', '\\times{').replace('ext{', '\\text{')
+                chunks = lecture_db.get_chunks(selected_lecture["id"])
+                # Weight selection toward the topics this student gets wrong
+                weak_topics = get_weak_topics(student_id)
+                weak_topic_weights = {row.topic: 1 - row.accuracy / 100 for row in weak_topics.itertuples()}
+                # Precomputed at ingest: a lookup, no TF-IDF fitting per click. Loaded before the
+                # topic lookup so lectures indexed on first use have their topic rows by then
+                chunk_index = lecture_db.chunk_index(selected_lecture["id"])
+                topic_scores = lecture_db.topic_chunk_scores(selected_lecture["id"], weak_topic_weights)
+                key_positions = chunk_index.key_chunks(topic_scores=topic_scores)
+                default_positions = chunk_index.key_chunks()
+                # Served from the pre-generated bank (stocked for the default chunks) when it has a
+                # quiz on this student's weak topics; generated on the spot otherwise
+                quiz_data = None
+                questions, skipped = [], 0
+                if not force_fresh:
+                    quiz_data = get_quiz_bank().take(
+                        selected_lecture["id"],
+                        default_positions,
+                        api_key=st.session_state.get("chatbot_api_key"),
+                        topics=weak_topic_weights if sorted(key_positions) != sorted(default_positions) else None
+                    )
+                if quiz_data is None and generation_mode == "Parallel per chunk":
+                    with st.spinner("Generating quiz..."):
+                        quiz_data = generate_quiz_parallel(
+                            [chunks[i] for i in key_positions],
+                            api_key=st.session_state.get("chatbot_api_key"),
+                            force_fresh=force_fresh
+                        )
+                    lecture_db.link_topics(
+                        selected_lecture["id"],
+                        {i: chunks[i] for i in key_positions},
+                        [q.get('topic') for q in quiz_data['questions']]
+                    )
+                elif quiz_data is None:
+                    # Stream: each question is shown as soon as it is complete (unless already seen)
+                    streamed = []
+                    preview = st.container()
+                    with st.spinner("Generating quiz..."):
+                        for q in stream_quiz(
+                            "\n".join(chunks[i] for i in key_positions),
+                            api_key=st.session_state.get("chatbot_api_key"),
+                            force_fresh=force_fresh
+                        ):
+                            streamed.append(q)
+                            new, rejected = filter_new_questions(student_id, selected_lecture["id"], [q])
+                            skipped += rejected
+                            for q in new:
+                                questions.append(q)
+                                preview.markdown(f"**Q{len(questions)}:** {q.get('question', '')}")
+                    lecture_db.link_topics(
+                        selected_lecture["id"],
+                        {i: chunks[i] for i in key_positions},
+                        [q.get('topic') for q in streamed]
+                    )
+                    quiz_data = {'questions': questions}
+
+                # Never repeat questions this student has already been given for this lecture
+                if quiz_data and not questions and not skipped:
+                    questions, skipped = filter_new_questions(
+                        student_id, selected_lecture["id"], quiz_data.get('questions', [])
+                    )
+                if skipped and len(questions) < MIN_NEW_QUESTIONS:
+                    # Mostly repeats: avoid these chunks and top up from the next most salient ones
+                    spare = [
+                        i for i in lecture_db.key_chunks(
+                            selected_lecture["id"], k=2 * len(key_positions), topic_scores=topic_scores
+                        )
+                        if i not in key_positions
+                    ]
+                    if spare:
+                        with st.spinner("Finding questions you have not seen yet..."):
+                            extra = generate_quiz_parallel(
+                                [chunks[i] for i in spare],
+                                api_key=st.session_state.get("chatbot_api_key"),
+                                force_fresh=True
+                            )
+                        more, rejected = find_new_questions(student_id, selected_lecture["id"], extra['questions'])
+                        # Only what is shown counts as seen
+                        more = more[:QUIZ_LENGTH - len(questions)]
+                        record_questions(student_id, selected_lecture["id"], more)
+                        questions += more
+                        skipped += rejected
+                if quiz_data is not None:
+                    quiz_data = {**quiz_data, 'questions': questions} if questions else None
+                if skipped:
+                    st.toast(f"Skipped {skipped} question(s) you have already seen")
                 
                 if quiz_data:
                     st.session_state.quiz = quiz_data
                     st.session_state.user_answers = {}
                     st.session_state.submitted = False
                     st.rerun()
+                elif skipped:
+                    st.warning("You have already seen every question we could generate for this lecture. "
+                               "Try another lecture, or check back after uploading more notes.")
                 else:
                     st.error("Invalid quiz format")
             except Exception as e:
@@ -588,8 +678,9 @@ with tab2:
                     st.error("Please answer all questions!")
                 else:
                     try:
-                        log_quiz_result(
-                            student_id=1,
+                        # Queued and written in the background; returns without touching the database
+                        get_result_writer().submit(
+                            student_id=student_id,
                             questions=[
                                 {**q, 'student_answer': st.session_state.user_answers[i]}
                                 for i, q in enumerate(st.session_state.quiz['questions'])
@@ -676,38 +767,87 @@ with tab2:
 
     
 
-        progress_df = get_student_progress(1)
-        weak_topics_df = get_weak_topics(1)
+        time_windows = {"All time": None, "Last 7 days": 7, "Last 30 days": 30, "Last 90 days": 90}
+        resolutions = {"Auto": None, "Daily": "day", "Weekly": "week"}
+        col1, col2 = st.columns(2)
+        with col1:
+            window_days = time_windows[st.selectbox("Time window", list(time_windows), key="progress_window")]
+        with col2:
+            bucket = resolutions[st.selectbox(
+                "Chart resolution",
+                list(resolutions),
+                key="progress_resolution",
+                help=f"Auto plots every quiz, thinned to {CHART_POINT_BUDGET} points for long histories"
+            )]
+        # Whole days (stored timestamps are UTC), so the window only changes once a day
+        since = (datetime.utcnow().date() - timedelta(days=window_days)).isoformat() if window_days else None
+
+        # Rebuilt only when this student's results change; other reruns are served from the cache
+        def build_dashboard(student_id, since, bucket, data_version):
+            summary = get_student_summary(student_id, since=since)
+            if not summary['quizzes']:
+                return summary, None, None, 0
+            # The chart never gets more than CHART_POINT_BUDGET points, however long the history
+            progress_df = get_student_progress(student_id, since=since, bucket=bucket)
+            progress_df = downsample_progress(progress_df, CHART_POINT_BUDGET)
+            weak_topics_df = get_weak_topics(student_id, since=since)
+
+            progress_fig = px.line(progress_df, x='timestamp', y='score', markers=True)
+            progress_fig.update_layout(
+                xaxis_title="Timestamp"
+            )
+            weak_topics_fig = None
+            if not weak_topics_df.empty:
+                weak_topics_fig = px.bar(weak_topics_df, x='accuracy', y='topic', orientation='h')
+                weak_topics_fig.update_layout(
+                xaxis_title="Accuracy"
+            )
+            return summary, progress_fig, weak_topics_fig, len(weak_topics_df)
+        load_dashboard = st.cache_data(show_spinner=False, max_entries=256)(build_dashboard)
+
+        # Queued results are not in the data version until the writer commits them,
+        # so a cached dashboard would outlive them; build it fresh until they land
+        if get_result_writer().pending(student_id):
+            load_dashboard = build_dashboard
+        summary, progress_fig, weak_topics_fig, weak_topic_count = load_dashboard(
+            student_id, since, bucket, get_data_version(student_id)
+        )
         
-        if not progress_df.empty:
+        if summary['quizzes']:
             col1, col2, col3 = st.columns(3)
             with col1:
-                st.metric("Total Quizzes", len(progress_df))
+                st.metric("Total Quizzes", summary['quizzes'])
             with col2:
-                avg_score = progress_df['score'].mean().round(1)
+                avg_score = round(summary['average_score'], 1)
                 st.metric("Average Score", f"{avg_score}%")
             with col3:
-                st.metric("Weak Topics", len(weak_topics_df))
+                st.metric("Weak Topics", weak_topic_count)
             
             st.subheader("Accuracy Over Time")
-            fig = px.line(progress_df, x='timestamp', y='score', markers=True)
-            fig.update_layout(
-                xaxis_title="Timestamp"
-            )
-            st.plotly_chart(fig)
+            st.plotly_chart(progress_fig)
             
             st.subheader("Weak Topics")
-            if not weak_topics_df.empty:
-                fig = px.bar(weak_topics_df, x='accuracy', y='topic', orientation='h')
-                fig.update_layout(
-                xaxis_title="Accuracy"
-            )
-                st.plotly_chart(fig)
+            if weak_topics_fig is not None:
+                st.plotly_chart(weak_topics_fig)
             else:
                 st.success("🎉 No weak topics identified!")
         else:
             st.info("📊 No quiz data available yet. Take some quizzes to see progress!")
 
+        # LLM latency and spend per call site, over the same time window. Only queried on request
+        # (collapsed expanders still run), and cached until another call is recorded
+        @st.cache_data(show_spinner=False, max_entries=16)
+        def load_llm_usage(since, last_call_id):
+            return llm_telemetry.summarize(since=since)
+
+        with st.expander("LLM usage"):
+            if st.checkbox("Show LLM latency and spend", key="show_llm_usage"):
+                llm_usage = load_llm_usage(since, last_llm_call_id())
+                if llm_usage.empty:
+                    st.caption("No LLM calls recorded in this window.")
+                else:
+                    st.dataframe(llm_usage.round(3), hide_index=True)
+
 
 #Tab 4: Lecture Management
 with tab4:
@@ -716,28 +856,32 @@ with tab4:
     # Real-time sync controls
     # col1, col2 = st.columns([3, 1])
     # with col1:
-    #     search_query = st.text_input("🔍 Search lectures by title or tags")
+    #     search_query = st.text_input("🔍 Search lectures by title, tags or content")
     # with col2:
     #     if st.button("🔄 Refresh Now", help="Force refresh lecture list"):
     #         st.session_state.lecture_cache_version += 1
     #         st.rerun()
-    search_query = st.text_input("🔍 Search lectures by title or tags")
+    search_query = st.text_input("🔍 Search lectures by title, tags or content")
     # Load lectures with reactive caching
     @st.cache_data(show_spinner=False, ttl=60)
     def load_managed_lectures(_lecture_db, cache_version):
-        return _lecture_db.get_all_lectures()
+        return _lecture_db.list_lectures()
     
     lectures = load_managed_lectures(
         lecture_db, 
         st.session_state.lecture_cache_version
     )
 
-    # Filtering and sorting logic
-    filtered_lectures = [lec for lec in lectures if 
-        search_query.lower() in lec["title"].lower() or
-        any(tag.lower().startswith(search_query.lower()) 
-            for tag in lec.get("tags", []))
-    ]
+    # Indexed search: ranked lecture hits plus the best matching passages
+    if search_query.strip():
+        search_results = lecture_db.search(search_query)
+        filtered_lectures = search_results["lectures"]
+        if search_results["chunks"]:
+            with st.expander(f"🔎 Matching passages ({len(search_results['chunks'])})", expanded=False):
+                for hit in search_results["chunks"]:
+                    st.markdown(f"**{hit['title']}** · section {hit['position'] + 1}  \n{hit['snippet']}")
+    else:
+        filtered_lectures = lectures
     
     # Display lectures with instant delete
     for lecture in filtered_lectures:
@@ -746,22 +890,31 @@ with tab4:
             with col1:
                 st.caption(f"📅 Uploaded: {lecture['upload_date']}")
                 st.write(f"🏷️ Tags: {', '.join(lecture.get('tags', [])) or 'None'}")
-                st.write(f"📦 Chunks: {len(lecture['chunks'])} sections")
+                st.write(f"📦 Chunks: {lecture['chunk_count']} sections")
             
             with col2:
                 if st.button("🗑️ Delete", key=f"del_{lecture['id']}"):
                     lecture_db.delete_lecture(lecture["id"])
+                    store_manager.release(lecture.get("vector_store_path"))
                     st.session_state.lecture_cache_version += 1
                     st.rerun()
             
             with col3:
-                st.download_button(
-                    label="📥 Export",
-                    data=json.dumps(lecture, indent=2),
-                    file_name=f"{lecture['title'].replace(' ', '_')}.json",
-                    mime="application/json",
-                    key=f"exp_{lecture['id']}"
-                )
+                # Bundles are only built when asked for, not on every rerun
+                bundle_key = f"bundle_{lecture['id']}"
+                if bundle_key in st.session_state:
+                    st.download_button(
+                        label="📥 Download",
+                        data=st.session_state[bundle_key],
+                        file_name=f"{lecture['title'].replace(' ', '_')}.zip",
+                        mime="application/zip",
+                        key=f"exp_{lecture['id']}",
+                        on_click=st.session_state.pop,
+                        args=(bundle_key, None)
+                    )
+                elif st.button("📦 Export", key=f"prep_{lecture['id']}"):
+                    st.session_state[bundle_key] = export_bundle(lecture_db, [lecture["id"]], BytesIO()).getvalue()
+                    st.rerun()
 
     # Bulk actions with instant feedback
     if filtered_lectures:
@@ -773,11 +926,75 @@ with tab4:
                 format_func=lambda x: x["title"]
             )
             
-            if st.button("🔥 Delete Selected", type="primary") and selected:
-                for lec in selected:
-                    lecture_db.delete_lecture(lec["id"])
+            selected_ids = [lec["id"] for lec in selected]
+
+            bulk_tags = st.multiselect("Tags:", tag_db.load_tags(), key="bulk_tags")
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                if st.button("🏷️ Add Tags") and selected and bulk_tags:
+                    lecture_db.retag_lectures(selected_ids, add_tags=bulk_tags)
+                    st.session_state.lecture_cache_version += 1
+                    st.rerun()
+            with col2:
+                if st.button("✂️ Remove Tags") and selected and bulk_tags:
+                    lecture_db.retag_lectures(selected_ids, remove_tags=bulk_tags)
+                    st.session_state.lecture_cache_version += 1
+                    st.rerun()
+            with col3:
+                if st.button("📂 Move to Tag", help="Replace all tags with the first selected tag") and selected and bulk_tags:
+                    lecture_db.move_to_tag(selected_ids, bulk_tags[0])
+                    st.session_state.lecture_cache_version += 1
+                    st.rerun()
+            with col4:
+                if st.button("🔥 Delete Selected", type="primary") and selected:
+                    store_paths = lecture_db.delete_lectures(selected_ids)
+                    store_manager.release_many(store_paths)
+                    st.session_state.lecture_cache_version += 1
+                    st.rerun()
+
+            if st.button("📦 Export Selected") and selected:
+                st.session_state.bulk_bundle = export_bundle(lecture_db, selected_ids, BytesIO()).getvalue()
+            if "bulk_bundle" in st.session_state:
+                st.download_button(
+                    label="📥 Download Bundle",
+                    data=st.session_state.bulk_bundle,
+                    file_name="studybuddy_lectures.zip",
+                    mime="application/zip",
+                    on_click=st.session_state.pop,
+                    args=("bulk_bundle", None)
+                )
+
+    # Import lectures exported from another deployment
+    with st.expander("📥 Import Lecture Bundle", expanded=False):
+        bundle_file = st.file_uploader("Upload a bundle (.zip)", type=["zip"], key="bundle_upload")
+        if bundle_file and st.button("Import Bundle"):
+            try:
+                imported = import_bundle(lecture_db, bundle_file, os.getenv("OPENAI_API_KEY") or openai_api_key)
                 st.session_state.lecture_cache_version += 1
-                st.rerun()
+                if imported:
+                    st.success(f"Imported {len(imported)} lecture(s): {', '.join(imported)}")
+                else:
+                    st.info("All lectures in this bundle already exist.")
+            except (ValueError, KeyError, zipfile.BadZipFile) as e:
+                st.error(f"Import failed: {str(e)}")
+
+    # Storage maintenance
+    with st.expander("🧹 Storage Maintenance", expanded=False):
+        st.caption("Merge duplicate vector stores, remove stores no lecture uses, and check chunk compression.")
+        if st.button("Reclaim Disk Space"):
+            report = store_manager.compact()
+            st.session_state.lecture_cache_version += 1
+            st.success(
+                f"Merged {len(report['merged'])} duplicate and removed {len(report['removed'])} orphaned stores, "
+                f"recovered {report['bytes_reclaimed'] / 1024:.1f} KB"
+            )
+        if st.button("Chunk Storage Report"):
+            stats = lecture_db.chunk_storage_stats()
+            st.write(
+                f"{stats['lectures']} lectures, {stats['raw_bytes'] / 1024:.1f} KB of text stored in "
+                f"{stats['stored_bytes'] / 1024:.1f} KB ({', '.join(stats['codecs']) or 'n/a'}): "
+                f"ratio {stats['ratio']:.2f}x, decoding at {stats['decode_mb_per_s']:.0f} MB/s"
+            )
 
 
 # Helper function for tab5
@@ -1046,10 +1263,10 @@ with tab5:
                     if len(parts) >= 1:
                         mermaid_code = parts[0].strip()
                         with message_placeholder:
-                            # Create a separate client for Mermaid validation using GPT-3.5 Turbo
-                            validation_client = ChatOpenAI(
+                            # Separate low-temperature model for Mermaid validation, shared like the chat client
+                            validation_client = get_chat_model(
                                 api_key=openai_api_key,
-                                model_name="gpt-4-turbo",
+                                model="gpt-4-turbo",
                                 temperature=0.1
                             )
                             
@@ -1071,10 +1288,12 @@ with tab5:
                             """
 
                             try:
-                                validation_response = validation_client.invoke([{
-                                    "role": "user",
-                                    "content": validation_prompt
-                                }])
+                                with llm_telemetry.track("mermaid_validation", "gpt-4-turbo", cache="none") as call:
+                                    validation_response = validation_client.invoke([{
+                                        "role": "user",
+                                        "content": validation_prompt
+                                    }])
+                                    call.set_usage(validation_response.usage_metadata)
                                 
                                 # Extract validated/corrected code
                                 validated_code = validation_response.content
@@ -1124,7 +1343,9 @@ with tab5:
             api_messages = [msg for msg in st.session_state.messages if msg["role"] != "system"]
             api_messages.insert(0, st.session_state.messages[0])
         
-        response = client.invoke(api_messages)
+        with llm_telemetry.track("chat", model, cache="none") as call:
+            response = client.invoke(api_messages)
+            call.set_usage(response.usage_metadata)
         msg = response.content  # Extract content from the response
         
         st.session_state.messages.append({"role": "assistant", "content": msg})
@@ -0,0 +1,161 @@
+import os
+import json
+import shutil
+import zipfile
+from pathlib import Path
+from typing import BinaryIO, List
+
+from storage import PROJECT_ROOT, VECTOR_STORE_ROOT
+from embeddings import BACKEND_MANIFEST, DEFAULT_BACKEND, backend_signature, read_backend_manifest
+from rag import RAG
+
+
+BUNDLE_FORMAT = "studybuddy-bundle"
+BUNDLE_VERSION = 1
+# The only store files carried by a bundle. index.pkl is a pickle, and
+# unpickling an uploaded file would run whatever code it holds
+STORE_FILES = ("index.faiss", BACKEND_MANIFEST)
+
+
+def export_bundle(lecture_db, lecture_ids: List[str], fileobj: BinaryIO) -> BinaryIO:
+    """
+    Write lectures as a portable zip bundle to fileobj
+
+    Layout:
+        manifest.json                 lecture metadata
+        lectures/<id>/chunks.jsonl    one chunk per line
+        stores/<name>/...             FAISS index and embedding backend, so
+                                      imports need no re-embedding
+
+    Chunks are decoded one lecture at a time. The zip is written to fileobj,
+    so it is only held in memory as a whole if fileobj is a BytesIO (as in
+    the app, which needs the bytes for st.download_button).
+    """
+    catalogue = {lecture["id"]: lecture for lecture in lecture_db.list_lectures()}
+    manifest = {"format": BUNDLE_FORMAT, "version": BUNDLE_VERSION, "lectures": []}
+    written_stores = set()
+
+    with zipfile.ZipFile(fileobj, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        for lecture_id in lecture_ids:
+            lecture = catalogue.get(lecture_id)
+            if not lecture:
+                continue
+            with zf.open(f"lectures/{lecture_id}/chunks.jsonl", "w") as f:
+                for chunk in lecture_db.get_chunks(lecture_id):
+                    f.write(json.dumps(chunk, ensure_ascii=False).encode("utf-8") + b"\n")
+
+            store_name = None
+            if lecture.get("vector_store_path"):
+                store_path = Path(lecture["vector_store_path"])
+                if not store_path.is_absolute():
+                    store_path = PROJECT_ROOT / store_path
+                if store_path.is_dir():
+                    store_name = store_path.name
+                    if store_name not in written_stores:
+                        for name in STORE_FILES:
+                            if (store_path / name).is_file():
+                                zf.write(store_path / name, f"stores/{store_name}/{name}")
+                        written_stores.add(store_name)
+
+            manifest["lectures"].append({
+                "id": lecture_id,
+                "title": lecture["title"],
+                "upload_date": lecture.get("upload_date"),
+                "file_name": lecture.get("file_name"),
+                "tags": lecture.get("tags", []),
+                "chunk_count": lecture["chunk_count"],
+                "store": store_name
+            })
+        zf.writestr("manifest.json", json.dumps(manifest, ensure_ascii=False, indent=2))
+    return fileobj
+
+
+def _unique_store_dir(name: str) -> Path:
+    dest = VECTOR_STORE_ROOT / name
+    suffix = 1
+    while dest.exists():
+        dest = VECTOR_STORE_ROOT / f"{name}_{suffix}"
+        suffix += 1
+    return dest
+
+
+def _restore_store(zf: zipfile.ZipFile, store: str, texts: List[str], openai_api_key: str = None):
+    """
+    Rebuild a bundled store from the lecture's chunk texts and return its path,
+    or None if it cannot be built. The bundled FAISS index is reused when it
+    was built with the configured embedding backend and holds one vector per
+    chunk; otherwise the chunks are embedded again. Any index.pkl is ignored.
+    """
+    names = set(zf.namelist())
+    dest = _unique_store_dir(store)
+    dest.mkdir(parents=True)
+    try:
+        for name in STORE_FILES:
+            if f"stores/{store}/{name}" in names:
+                with zf.open(f"stores/{store}/{name}") as src, open(dest / name, "wb") as dst:
+                    shutil.copyfileobj(src, dst)
+        rag = RAG(openai_api_key=openai_api_key)
+        reusable = ((dest / "index.faiss").exists()
+                    and read_backend_manifest(dest) == backend_signature(DEFAULT_BACKEND))
+        try:
+            rag.rebuild(texts, dest if reusable else None)
+        except ValueError as e:
+            if not reusable:
+                raise
+            print(f"Re-embedding store {store}: {str(e)}")
+            rag.rebuild(texts)
+        rag.save(dest)
+    except Exception as e:
+        print(f"Could not rebuild vector store {store}: {str(e)}")
+        shutil.rmtree(dest, ignore_errors=True)
+        return None
+    return os.path.relpath(dest, PROJECT_ROOT)
+
+
+def import_bundle(lecture_db, fileobj: BinaryIO, openai_api_key: str = None) -> List[str]:
+    """
+    Import a bundle written by export_bundle.
+    Lectures whose id already exists are skipped. Returns the titles imported.
+    Vector stores are rebuilt from the chunks (see _restore_store); a lecture
+    whose store cannot be rebuilt is imported without one.
+    """
+    with zipfile.ZipFile(fileobj) as zf:
+        try:
+            manifest = json.loads(zf.read("manifest.json"))
+        except KeyError:
+            raise ValueError("Not a StudyBuddy bundle: manifest.json is missing")
+        if manifest.get("format") != BUNDLE_FORMAT or manifest.get("version", 0) > BUNDLE_VERSION:
+            raise ValueError("Unsupported bundle format")
+
+        existing = {lecture["id"] for lecture in lecture_db.list_lectures()}
+        imported_stores = {}
+        imported = []
+
+        for entry in manifest["lectures"]:
+            lecture_id = entry["id"]
+            if lecture_id in existing:
+                continue
+
+            with zf.open(f"lectures/{lecture_id}/chunks.jsonl") as f:
+                chunks = [json.loads(line) for line in f if line.strip()]
+
+            store = entry.get("store")
+            vector_store_path = None
+            if store:
+                # Only basenames are accepted so entries cannot escape the store root
+                store = os.path.basename(store)
+                if store not in imported_stores:
+                    imported_stores[store] = _restore_store(zf, store, chunks, openai_api_key)
+                vector_store_path = imported_stores[store]
+
+            lecture_db.import_lectures([{
+                "id": lecture_id,
+                "title": entry["title"],
+                "upload_date": entry.get("upload_date"),
+                "file_name": entry.get("file_name"),
+                "chunks": chunks,
+                "tags": entry.get("tags", []),
+                "vector_store_path": vector_store_path
+            }])
+            imported.append(entry["title"])
+    return imported
@@ -0,0 +1,84 @@
+import os
+import json
+import zlib
+from typing import List, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+# Chunks are split with a 300 character overlap, so each chunk usually
+# starts with the tail of the previous one. Only the new part is stored.
+DEFAULT_CODEC = os.getenv("CHUNK_CODEC") or ("zstd" if zstandard else "zlib")
+_PROBE = 64
+
+
+def _overlap(prev: str, nxt: str) -> int:
+    """Length of the longest suffix of prev that nxt starts with (at least _PROBE characters)"""
+    probe = nxt[:_PROBE]
+    if len(probe) < _PROBE:
+        return 0
+    pos = prev.find(probe, max(0, len(prev) - len(nxt)))
+    while pos != -1:
+        if nxt.startswith(prev[pos:]):
+            return len(prev) - pos
+        pos = prev.find(probe, pos + 1)
+    return 0
+
+
+def delta_encode(chunks: List[str]) -> list:
+    """[[overlap, new_text], ...] where overlap counts characters reused from the previous chunk"""
+    encoded, prev = [], ""
+    for chunk in chunks:
+        overlap = _overlap(prev, chunk)
+        encoded.append([overlap, chunk[overlap:]])
+        prev = chunk
+    return encoded
+
+
+def delta_decode(encoded: list) -> List[str]:
+    chunks, prev = [], ""
+    for overlap, tail in encoded:
+        chunk = (prev[len(prev) - overlap:] if overlap else "") + tail
+        chunks.append(chunk)
+        prev = chunk
+    return chunks
+
+
+def encode_chunks(chunks: List[str], codec: str = None) -> Tuple[str, bytes, int]:
+    """
+    Pack one lecture's chunks into a single blob
+
+    Returns:
+        (codec, data, raw_size) where raw_size is the UTF-8 size of the chunk texts
+    """
+    codec = codec or DEFAULT_CODEC
+    raw_size = sum(len(chunk.encode("utf-8")) for chunk in chunks)
+    payload = json.dumps(delta_encode(chunks), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd chunk codec requires the zstandard package")
+        data = zstandard.ZstdCompressor(level=10).compress(payload)
+    elif codec == "zlib":
+        data = zlib.compress(payload, 9)
+    elif codec == "none":
+        data = payload
+    else:
+        raise ValueError(f"Unknown chunk codec: {codec}")
+    return codec, data, raw_size
+
+
+def decode_chunks(codec: str, data: bytes) -> List[str]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise ValueError("Lecture was stored with zstd but the zstandard package is not installed")
+        payload = zstandard.ZstdDecompressor().decompress(data)
+    elif codec == "zlib":
+        payload = zlib.decompress(data)
+    elif codec == "none":
+        payload = data
+    else:
+        raise ValueError(f"Unknown chunk codec: {codec}")
+    return delta_decode(json.loads(payload))
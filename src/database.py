@@ -1,10 +1,137 @@
+import os
+import re
+import json
+import time
 import sqlite3
+import threading
 import pandas as pd
 from pathlib import Path
+from contextlib import contextmanager
 
-def init_db():
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
+import chunk_codec
+
+DB_PATH = Path(__file__).parent.parent / "data" / "progress.db"
+
+# Applied to every new connection. WAL lets readers run alongside a writer,
+# and NORMAL sync is durable across application crashes in WAL mode.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+
+_local = threading.local()
+# Connections of threads that have ended, ready for the next thread: Streamlit
+# runs every rerun on a new thread, which would otherwise reconnect each time
+_idle_connections = {}
+_pool_lock = threading.RLock()
+_pool_pid = os.getpid()
+MAX_IDLE_CONNECTIONS = 8
+_init_lock = threading.Lock()
+_initialized = set()
+
+# Bumped whenever a student's quiz results change, so callers can key caches on it
+_data_versions = {}
+_versions_lock = threading.Lock()
+
+def get_data_version(student_id: int) -> int:
+    """Version of a student's progress data in this process; changes after every write"""
+    return _data_versions.get(student_id, 0)
+
+def _bump_data_versions(student_ids):
+    with _versions_lock:
+        for student_id in student_ids:
+            _data_versions[student_id] = _data_versions.get(student_id, 0) + 1
+
+class _Lease:
+    """The connections one thread holds; returned to the idle pool when the thread ends"""
+    def __init__(self):
+        self.pid = os.getpid()
+        self.connections = {}
+
+    def __del__(self):
+        if self.pid != os.getpid():
+            return
+        with _pool_lock:
+            for key, conn in self.connections.items():
+                try:
+                    if conn.in_transaction:
+                        conn.rollback()
+                    idle = _idle_connections.setdefault(key, [])
+                    if len(idle) < MAX_IDLE_CONNECTIONS:
+                        idle.append(conn)
+                    else:
+                        conn.close()
+                except sqlite3.Error:
+                    pass
+
+def _checkout(key: str):
+    global _idle_connections, _pool_pid
+    with _pool_lock:
+        if _pool_pid != os.getpid():
+            # Never reuse connections inherited through fork
+            _idle_connections, _pool_pid = {}, os.getpid()
+        idle = _idle_connections.get(key)
+        return idle.pop() if idle else None
+
+def get_connection(db_path=None) -> sqlite3.Connection:
+    """
+    Connection for the calling thread, which keeps it until the thread ends.
+    Connections then go back to a small pool and are handed to later threads,
+    so PRAGMAs run once and statement caches persist across Streamlit reruns.
+    Callers must not close them.
+    """
+    db_path = Path(db_path) if db_path else DB_PATH
+    lease = getattr(_local, 'lease', None)
+    if lease is None or lease.pid != os.getpid():
+        lease = _local.lease = _Lease()
+    key = str(db_path)
+    conn = lease.connections.get(key)
+    if conn is None:
+        conn = _checkout(key)
+        if conn is None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            # Other processes may hold the write lock; wait for it instead of failing.
+            # Only ever used by one thread at a time, but may move to another one later
+            conn = sqlite3.connect(db_path, timeout=30, cached_statements=256, check_same_thread=False)
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+        lease.connections[key] = conn
+    return conn
+
+@contextmanager
+def read_snapshot(conn: sqlite3.Connection):
+    """Run several SELECTs against one consistent snapshot"""
+    if conn.in_transaction:
+        yield conn.cursor()
+        return
+    conn.execute('BEGIN')
+    try:
+        yield conn.cursor()
+    finally:
+        conn.execute('COMMIT')
+
+def _upgrade_lecture_tables(c):
+    """
+    The first lecture tables used integer ids and were never written by the app.
+    Park them so the uuid-keyed tables below can take their names.
+    """
+    columns = [row[1] for row in c.execute("PRAGMA table_info(lectures)")]
+    if columns and 'upload_date' not in columns:
+        c.execute('ALTER TABLE lectures RENAME TO lectures_legacy')
+        c.execute('ALTER TABLE lecture_chunks RENAME TO lecture_chunks_legacy')
+
+def init_db(db_path=None):
+    """Create and migrate the schema. Runs once per process and database file."""
+    db_path = Path(db_path) if db_path else DB_PATH
+    with _init_lock:
+        if (os.getpid(), db_path) in _initialized:
+            return
+        _create_schema(get_connection(db_path))
+        _initialized.add((os.getpid(), db_path))
+
+def _create_schema(conn):
     c = conn.cursor()
     c.execute('''CREATE TABLE IF NOT EXISTS quizzes
                  (id INTEGER PRIMARY KEY, 
@@ -19,123 +146,929 @@ def init_db():
                   topic TEXT)''')  # ← MUST HAVE THIS LINE
     c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_id 
                  ON questions (quiz_id)''')
-    c.execute('''CREATE INDEX IF NOT EXISTS idx_student_id 
-                 ON quizzes (student_id)''')
+    # Per-student history is always read in time order, often within a window
+    c.execute('DROP INDEX IF EXISTS idx_student_id')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_student_time
+                 ON quizzes (student_id, timestamp)''')
+    # Lets queued submissions be replayed after a crash without double counting
+    if 'submission_id' not in [row[1] for row in c.execute("PRAGMA table_info(quizzes)")]:
+        c.execute('ALTER TABLE quizzes ADD COLUMN submission_id TEXT')
+    c.execute('''CREATE UNIQUE INDEX IF NOT EXISTS idx_quiz_submission
+                 ON quizzes (submission_id)''')
+    _init_progress_aggregates(c)
+    _upgrade_lecture_tables(c)
     c.execute('''CREATE TABLE IF NOT EXISTS lectures
-                 (id INTEGER PRIMARY KEY,
+                 (id TEXT PRIMARY KEY,
                   title TEXT,
+                  upload_date TEXT,
                   file_name TEXT,
                   vector_store_path TEXT,
                   tags TEXT,
                   timestamp DATETIME DEFAULT CURRENT_TIMESTAMP)''')
     c.execute('''CREATE TABLE IF NOT EXISTS lecture_chunks
                  (id INTEGER PRIMARY KEY,
-                  lecture_id INTEGER,
+                  lecture_id TEXT,
+                  position INTEGER,
                   chunk_content TEXT,
                   FOREIGN KEY(lecture_id) REFERENCES lectures(id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_chunk_lecture
+                 ON lecture_chunks (lecture_id, position)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_lecture_store
+                 ON lectures (vector_store_path)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS lecture_chunk_blobs
+                 (lecture_id TEXT PRIMARY KEY,
+                  codec TEXT,
+                  raw_size INTEGER,
+                  data BLOB)''')
+    _drop_external_chunk_index(c)
+    compressed = _compress_plain_chunks(c)
+    _init_search_index(c)
+    _init_topic_index(c)
+    _init_quiz_bank(c)
+    _init_quiz_cache(c)
+    _init_question_signatures(c)
+    _init_llm_calls(c)
+    c.execute('''CREATE TABLE IF NOT EXISTS lecture_tfidf
+                 (lecture_id TEXT PRIMARY KEY,
+                  data BLOB)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_tfidf_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM lecture_tfidf WHERE lecture_id = old.id;
+                 END''')
     conn.commit()
-    conn.close()
+    if compressed:
+        # Give the space freed by the plain-text chunks back to the file system
+        conn.execute('VACUUM')
 
-def log_quiz_result(student_id: int, questions: list):
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
-    c = conn.cursor()
-    c.execute('''INSERT INTO quizzes (student_id, timestamp)
-                 VALUES (?, datetime('now'))''', (student_id,))
-    quiz_id = c.lastrowid
-    for q in questions:
-        c.execute('''INSERT INTO questions 
-                     (quiz_id, question, student_answer, correct_answer, topic)
-                     VALUES (?, ?, ?, ?, ?)''',
-                  (quiz_id, 
-                   q['question'], 
-                   q.get('student_answer', ''), 
-                   q['answer'],
-                   q.get('topic', 'general')))  # Added topic
-    conn.commit()
-    conn.close()
-
-def get_student_progress(student_id: int) -> pd.DataFrame:
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
-    query = '''
-    SELECT qz.timestamp, 
-           SUM(CASE WHEN q.student_answer = q.correct_answer THEN 1 ELSE 0 END) AS correct,
-           COUNT(*) AS total,
-           (SUM(CASE WHEN q.student_answer = q.correct_answer THEN 1 ELSE 0 END) * 1.0 / COUNT(*)) * 100 AS score
+def _init_progress_aggregates(c):
+    """
+    Correctness is stored per question when it is written, and rolled up into
+    quiz_scores (one row per quiz) and topic_stats (one row per student and
+    topic) by log_quiz_batch, so the dashboard never re-scans the questions.
+    """
+    if 'is_correct' not in [row[1] for row in c.execute("PRAGMA table_info(questions)")]:
+        c.execute('ALTER TABLE questions ADD COLUMN is_correct INTEGER')
+        c.execute('''UPDATE questions
+                     SET is_correct = COALESCE(student_answer = correct_answer, 0)''')
+    backfill = not _table_exists(c, 'quiz_scores')
+    c.execute('''CREATE TABLE IF NOT EXISTS quiz_scores
+                 (quiz_id INTEGER PRIMARY KEY,
+                  student_id INTEGER,
+                  timestamp DATETIME,
+                  correct INTEGER,
+                  total INTEGER)''')
+    c.execute('DROP INDEX IF EXISTS idx_quiz_scores_student')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_scores_student_time
+                 ON quiz_scores (student_id, timestamp)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS topic_stats
+                 (student_id INTEGER,
+                  topic TEXT,
+                  correct INTEGER,
+                  total INTEGER,
+                  PRIMARY KEY (student_id, topic)) WITHOUT ROWID''')
+    if backfill:
+        c.execute('''INSERT INTO quiz_scores (quiz_id, student_id, timestamp, correct, total)
+                     SELECT qz.id, qz.student_id, qz.timestamp, SUM(q.is_correct), COUNT(*)
+                     FROM quizzes qz JOIN questions q ON q.quiz_id = qz.id
+                     GROUP BY qz.id''')
+        c.execute('''INSERT OR REPLACE INTO topic_stats (student_id, topic, correct, total)
+                     SELECT qz.student_id, COALESCE(q.topic, 'general'), SUM(q.is_correct), COUNT(*)
+                     FROM questions q JOIN quizzes qz ON q.quiz_id = qz.id
+                     GROUP BY qz.student_id, COALESCE(q.topic, 'general')''')
+
+def _table_exists(c, name: str) -> bool:
+    return c.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def _init_search_index(c):
+    """
+    Tag-to-lecture inverted index and FTS5 indexes over titles and chunk text.
+    Triggers keep them in step with every write to the lecture tables,
+    including batch operations. Existing rows are indexed the first time.
+    """
+    new_tag_index = not _table_exists(c, 'lecture_tags')
+    c.execute('''CREATE TABLE IF NOT EXISTS lecture_tags
+                 (tag TEXT COLLATE NOCASE,
+                  lecture_id TEXT,
+                  PRIMARY KEY (tag, lecture_id))''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_lecture_tags_lecture
+                 ON lecture_tags (lecture_id)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_tags_ai AFTER INSERT ON lectures BEGIN
+                 INSERT OR IGNORE INTO lecture_tags (tag, lecture_id)
+                 SELECT value, new.id FROM json_each(COALESCE(new.tags, '[]'));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_tags_au AFTER UPDATE OF tags ON lectures BEGIN
+                 DELETE FROM lecture_tags WHERE lecture_id = old.id;
+                 INSERT OR IGNORE INTO lecture_tags (tag, lecture_id)
+                 SELECT value, new.id FROM json_each(COALESCE(new.tags, '[]'));
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_tags_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM lecture_tags WHERE lecture_id = old.id;
+                 END''')
+    if new_tag_index:
+        c.execute('''INSERT OR IGNORE INTO lecture_tags (tag, lecture_id)
+                     SELECT j.value, l.id FROM lectures l, json_each(COALESCE(l.tags, '[]')) j''')
+
+    try:
+        new_fts = not _table_exists(c, 'chunk_fts')
+        # Chunk text is stored compressed, so the index keeps no copy of it (contentless)
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts
+                     USING fts5(chunk_content, content='')''')
+        new_title_fts = not _table_exists(c, 'lecture_title_fts')
+        c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS lecture_title_fts
+                     USING fts5(title, lecture_id UNINDEXED)''')
+    except sqlite3.OperationalError:
+        # SQLite built without FTS5: search_lectures falls back to scanning chunks
+        return
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_title_fts_ai AFTER INSERT ON lectures BEGIN
+                 INSERT INTO lecture_title_fts (title, lecture_id) VALUES (new.title, new.id);
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_title_fts_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM lecture_title_fts WHERE lecture_id = old.id;
+                 END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS lecture_title_fts_au AFTER UPDATE OF title ON lectures BEGIN
+                 DELETE FROM lecture_title_fts WHERE lecture_id = old.id;
+                 INSERT INTO lecture_title_fts (title, lecture_id) VALUES (new.title, new.id);
+                 END''')
+    if new_title_fts:
+        c.execute('''INSERT INTO lecture_title_fts (title, lecture_id)
+                     SELECT title, id FROM lectures''')
+    if new_fts:
+        for (lecture_id,) in c.execute('SELECT lecture_id FROM lecture_chunk_blobs').fetchall():
+            _index_chunks(c, lecture_id, _read_chunks(c, lecture_id))
+
+def _init_topic_index(c):
+    """
+    Topic-to-chunk index: which chunks of a lecture cover a topic. Filled
+    with each chunk's most distinctive terms when its ChunkIndex is saved, and extended with the
+    topic names of generated questions, so the topics in the questions table
+    map straight to chunk positions.
+    """
+    new_index = not _table_exists(c, 'chunk_topics')
+    c.execute('''CREATE TABLE IF NOT EXISTS chunk_topics
+                 (lecture_id TEXT,
+                  topic TEXT,
+                  position INTEGER,
+                  weight REAL,
+                  PRIMARY KEY (lecture_id, topic, position)) WITHOUT ROWID''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS chunk_topics_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM chunk_topics WHERE lecture_id = old.id;
+                 END''')
+    if new_index and _table_exists(c, 'lecture_tfidf'):
+        # Topic rows are written with each chunk index, so rebuild those on first use
+        c.execute('DELETE FROM lecture_tfidf')
+
+def _init_quiz_bank(c):
+    """Quizzes generated ahead of time, keyed by lecture and the chunk positions they cover"""
+    c.execute('''CREATE TABLE IF NOT EXISTS quiz_bank
+                 (id INTEGER PRIMARY KEY,
+                  lecture_id TEXT,
+                  chunk_key TEXT,
+                  quiz TEXT,
+                  created DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_bank_lookup
+                 ON quiz_bank (lecture_id, chunk_key)''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS quiz_bank_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM quiz_bank WHERE lecture_id = old.id;
+                 END''')
+
+def _init_quiz_cache(c):
+    """Generated quizzes keyed by a hash of the prompt inputs; see quiz_generator.quiz_cache_key"""
+    c.execute('''CREATE TABLE IF NOT EXISTS quiz_cache
+                 (key TEXT PRIMARY KEY,
+                  quiz TEXT,
+                  size INTEGER,
+                  last_used DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_quiz_cache_last_used
+                 ON quiz_cache (last_used)''')
+
+def _init_question_signatures(c):
+    """
+    MinHash signatures of the questions each student has been given per lecture,
+    with an LSH band index over them; see question_dedup
+    """
+    c.execute('''CREATE TABLE IF NOT EXISTS question_signatures
+                 (id INTEGER PRIMARY KEY,
+                  student_id INTEGER,
+                  lecture_id TEXT,
+                  question TEXT,
+                  signature BLOB,
+                  created DATETIME DEFAULT CURRENT_TIMESTAMP)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_question_signatures_lecture
+                 ON question_signatures (lecture_id)''')
+    c.execute('''CREATE TABLE IF NOT EXISTS question_lsh
+                 (student_id INTEGER,
+                  lecture_id TEXT,
+                  bucket INTEGER,
+                  signature_id INTEGER,
+                  PRIMARY KEY (student_id, lecture_id, bucket, signature_id)) WITHOUT ROWID''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS question_signatures_ad AFTER DELETE ON lectures BEGIN
+                 DELETE FROM question_lsh WHERE signature_id IN
+                     (SELECT id FROM question_signatures WHERE lecture_id = old.id);
+                 DELETE FROM question_signatures WHERE lecture_id = old.id;
+                 END''')
+
+def _init_llm_calls(c):
+    """One row per LLM call (or cache hit standing in for one); see llm_telemetry"""
+    c.execute('''CREATE TABLE IF NOT EXISTS llm_calls
+                 (id INTEGER PRIMARY KEY,
+                  timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                  call_site TEXT,
+                  model TEXT,
+                  prompt_tokens INTEGER,
+                  completion_tokens INTEGER,
+                  latency_ms REAL,
+                  first_token_ms REAL,
+                  retries INTEGER,
+                  cache TEXT,
+                  error TEXT)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_llm_calls_time
+                 ON llm_calls (timestamp)''')
+
+def _drop_external_chunk_index(c):
+    """The first chunk index read text straight from lecture_chunks; drop it before that text is compressed"""
+    row = c.execute("SELECT sql FROM sqlite_master WHERE name = 'chunk_fts'").fetchone()
+    if row and "content='lecture_chunks'" in row[0]:
+        c.execute('DROP TRIGGER IF EXISTS chunk_fts_ai')
+        c.execute('DROP TRIGGER IF EXISTS chunk_fts_ad')
+        c.execute('DROP TABLE chunk_fts')
+
+def _compress_plain_chunks(c) -> int:
+    """
+    Move chunk text still stored row by row into one compressed blob per lecture.
+    Returns the number of lectures converted.
+    """
+    lecture_ids = [row[0] for row in c.execute(
+        'SELECT DISTINCT lecture_id FROM lecture_chunks WHERE chunk_content IS NOT NULL'
+    ).fetchall()]
+    for lecture_id in lecture_ids:
+        chunks = [row[0] for row in c.execute('''SELECT chunk_content FROM lecture_chunks
+                                                 WHERE lecture_id = ? ORDER BY position''', (lecture_id,))]
+        _store_blob(c, lecture_id, chunks)
+        c.execute('UPDATE lecture_chunks SET chunk_content = NULL WHERE lecture_id = ?', (lecture_id,))
+    return len(lecture_ids)
+
+def log_quiz_result(student_id: int, questions: list, db_path=None):
+    log_quiz_batch([{'student_id': student_id, 'questions': questions}], db_path)
+
+def log_quiz_batch(submissions: list, db_path=None) -> int:
+    """
+    Write many quiz submissions in one transaction.
+
+    Each submission is {student_id, questions, [timestamp], [submission_id]}.
+    A submission_id that is already stored is skipped, so replaying a batch is safe.
+    Per-quiz and per-topic aggregates are updated in the same transaction.
+    Returns the number of quizzes written.
+    """
+    conn = get_connection(db_path)
+    written = 0
+    changed = set()
+    with conn:
+        c = conn.cursor()
+        question_rows, score_rows, topic_totals = [], [], {}
+        for submission in submissions:
+            c.execute('''INSERT OR IGNORE INTO quizzes (student_id, timestamp, submission_id)
+                         VALUES (?, COALESCE(?, datetime('now')), ?)''',
+                      (submission['student_id'], submission.get('timestamp'), submission.get('submission_id')))
+            if c.rowcount == 0:
+                continue
+            quiz_id = c.lastrowid
+            written += 1
+            changed.add(submission['student_id'])
+            correct = 0
+            for q in submission['questions']:
+                student_answer = q.get('student_answer', '')
+                # The model sometimes sends "topic": null; topic_stats needs a key
+                topic = q.get('topic') or 'general'
+                is_correct = int(student_answer is not None and student_answer == q['answer'])
+                correct += is_correct
+                question_rows.append((quiz_id, 
+                                      q['question'], 
+                                      student_answer, 
+                                      q['answer'],
+                                      topic,
+                                      is_correct))
+                totals = topic_totals.setdefault((submission['student_id'], topic), [0, 0])
+                totals[0] += is_correct
+                totals[1] += 1
+            if submission['questions']:
+                score_rows.append((quiz_id, submission['student_id'], correct, len(submission['questions'])))
+        c.executemany('''INSERT INTO questions 
+                         (quiz_id, question, student_answer, correct_answer, topic, is_correct)
+                         VALUES (?, ?, ?, ?, ?, ?)''', question_rows)
+        c.executemany('''INSERT INTO quiz_scores (quiz_id, student_id, timestamp, correct, total)
+                         SELECT ?, ?, timestamp, ?, ? FROM quizzes WHERE id = ?''',
+                      [row + (row[0],) for row in score_rows])
+        c.executemany('''INSERT INTO topic_stats (student_id, topic, correct, total)
+                         VALUES (?, ?, ?, ?)
+                         ON CONFLICT (student_id, topic) DO UPDATE
+                         SET correct = correct + excluded.correct,
+                             total = total + excluded.total''',
+                      [key + tuple(totals) for key, totals in topic_totals.items()])
+    # Only after the commit, so a cache keyed on the new version never sees old data
+    _bump_data_versions(changed)
+    return written
+
+def _time_window(since=None, until=None, column: str = 'timestamp'):
+    """SQL condition and parameters for an optional [since, until) window"""
+    clauses, params = [], []
+    if since is not None:
+        clauses.append(f'{column} >= ?')
+        params.append(str(since))
+    if until is not None:
+        clauses.append(f'{column} < ?')
+        params.append(str(until))
+    return ''.join(f' AND {clause}' for clause in clauses), params
+
+# SQLite expressions for the start of the day / Monday-based week of a timestamp
+_BUCKETS = {
+    'day': "date(timestamp)",
+    'week': "date(timestamp, '-6 days', 'weekday 1')",
+}
+
+def get_student_progress(student_id: int, since=None, until=None, limit: int = None, offset: int = 0,
+                         bucket: str = None, db_path=None) -> pd.DataFrame:
+    """
+    Score of each quiz the student has taken, oldest first, read from the quiz_scores rollup
+
+    Args:
+        since, until: Optional timestamp window [since, until), as 'YYYY-MM-DD[ HH:MM:SS]' strings
+        limit, offset: Optional page of the result
+        bucket: 'day' or 'week' to aggregate quizzes per period instead; timestamp is then
+                the period start, score is weighted by question count and quizzes counts them
+    """
+    conn = get_connection(db_path)
+    window, params = _time_window(since, until)
+    if bucket is None:
+        query = f'''
+        SELECT timestamp, correct, total, (correct * 1.0 / total) * 100 AS score
+        FROM quiz_scores
+        WHERE student_id = ?{window}
+        ORDER BY timestamp, quiz_id
+        LIMIT ? OFFSET ?
+        '''
+    elif bucket in _BUCKETS:
+        query = f'''
+        SELECT {_BUCKETS[bucket]} AS timestamp, SUM(correct) AS correct, SUM(total) AS total,
+               (SUM(correct) * 1.0 / SUM(total)) * 100 AS score, COUNT(*) AS quizzes
+        FROM quiz_scores
+        WHERE student_id = ?{window}
+        GROUP BY 1
+        ORDER BY 1
+        LIMIT ? OFFSET ?
+        '''
+    else:
+        raise ValueError(f"Unknown progress bucket: {bucket}")
+    params = [student_id, *params, -1 if limit is None else limit, offset]
+    return pd.read_sql_query(query, conn, params=params)
+
+def get_student_summary(student_id: int, since=None, until=None, db_path=None) -> dict:
+    """Quiz count and average score in a window, without loading the quizzes themselves"""
+    conn = get_connection(db_path)
+    window, params = _time_window(since, until)
+    quizzes, average_score = conn.execute(f'''
+        SELECT COUNT(*), AVG(correct * 100.0 / total)
+        FROM quiz_scores
+        WHERE student_id = ?{window}''', [student_id, *params]).fetchone()
+    return {'quizzes': quizzes, 'average_score': average_score}
+
+def get_weak_topics(student_id: int, since=None, until=None, db_path=None) -> pd.DataFrame:
+    """
+    Up to five topics under 60% accuracy. All-time results come from the
+    topic_stats rollup; a window aggregates only the quizzes inside it.
+    """
+    conn = get_connection(db_path)
+    if since is None and until is None:
+        query = '''
+        SELECT topic, (correct * 1.0 / total) * 100 AS accuracy
+        FROM topic_stats
+        WHERE student_id = ? AND correct * 100 < total * 60
+        ORDER BY accuracy ASC
+        LIMIT 5
+        '''
+        return pd.read_sql_query(query, conn, params=(student_id,))
+    window, params = _time_window(since, until, 'qz.timestamp')
+    query = f'''
+    SELECT COALESCE(q.topic, 'general') AS topic, (SUM(q.is_correct) * 1.0 / COUNT(*)) * 100 AS accuracy
     FROM quizzes qz
-    JOIN questions q ON qz.id = q.quiz_id
-    WHERE qz.student_id = ?
-    GROUP BY qz.id
-    '''
-    df = pd.read_sql_query(query, conn, params=(student_id,))
-    conn.close()
-    return df
-
-def get_weak_topics(student_id: int) -> pd.DataFrame:
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
-    query = '''
-    SELECT q.topic,
-           (SUM(CASE WHEN q.student_answer = q.correct_answer THEN 1 ELSE 0 END) * 1.0 / COUNT(*)) * 100 AS accuracy
-    FROM questions q
-    JOIN quizzes qz ON q.quiz_id = qz.id
-    WHERE qz.student_id = ?
-    GROUP BY q.topic
+    JOIN questions q ON q.quiz_id = qz.id
+    WHERE qz.student_id = ?{window}
+    GROUP BY COALESCE(q.topic, 'general')
     HAVING accuracy < 60
     ORDER BY accuracy ASC
     LIMIT 5
     '''
-    df = pd.read_sql_query(query, conn, params=(student_id,))
-    conn.close()
-    return df
+    return pd.read_sql_query(query, conn, params=[student_id, *params])
+
+def list_students(limit: int = 100, offset: int = 0, db_path=None) -> list:
+    """Ids of students with at least one quiz, one page at a time"""
+    conn = get_connection(db_path)
+    return [row[0] for row in conn.execute('''
+        SELECT DISTINCT student_id FROM quiz_scores
+        ORDER BY student_id LIMIT ? OFFSET ?''', (limit, offset))]
 
-def save_lecture(title: str, file_name: str, chunks: list, tags: list, vector_store_path: str):
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
+def _store_blob(c, lecture_id: str, chunks: list):
+    codec, data, raw_size = chunk_codec.encode_chunks(chunks)
+    c.execute('''INSERT OR REPLACE INTO lecture_chunk_blobs (lecture_id, codec, raw_size, data)
+                 VALUES (?, ?, ?, ?)''', (lecture_id, codec, raw_size, data))
+
+def _read_chunks(c, lecture_id: str) -> list:
+    """Decompress one lecture's chunks"""
+    row = c.execute('SELECT codec, data FROM lecture_chunk_blobs WHERE lecture_id = ?', (lecture_id,)).fetchone()
+    return chunk_codec.decode_chunks(*row) if row else []
+
+def _chunk_row_ids(c, lecture_id: str) -> list:
+    return [row[0] for row in c.execute('''SELECT id FROM lecture_chunks
+                                            WHERE lecture_id = ? ORDER BY position''', (lecture_id,))]
+
+def _index_chunks(c, lecture_id: str, chunks: list, command: str = None):
+    """Add chunks to the full-text index, or remove them with command='delete'"""
+    if not _table_exists(c, 'chunk_fts'):
+        return
+    ids = _chunk_row_ids(c, lecture_id)
+    if command:
+        c.executemany('''INSERT INTO chunk_fts (chunk_fts, rowid, chunk_content)
+                         VALUES (?, ?, ?)''', [(command, i, chunk) for i, chunk in zip(ids, chunks)])
+    else:
+        c.executemany('''INSERT INTO chunk_fts (rowid, chunk_content)
+                         VALUES (?, ?)''', list(zip(ids, chunks)))
+
+def link_topic_chunks(lecture_id: str, rows: list, db_path=None):
+    """Add (topic, position, weight) rows to a lecture's topic-to-chunk index (see salience.topic_links)"""
+    conn = get_connection(db_path)
+    with conn:
+        _insert_topic_rows(conn.cursor(), lecture_id, rows)
+
+def _insert_topic_rows(c, lecture_id: str, rows: list):
+    # Skipped if the lecture was deleted in the meantime
+    c.executemany('''INSERT OR REPLACE INTO chunk_topics (lecture_id, topic, position, weight)
+                     SELECT ?, ?, ?, ? WHERE EXISTS (SELECT 1 FROM lectures WHERE id = ?)''',
+                  [(lecture_id, topic, position, weight, lecture_id) for topic, position, weight in rows])
+
+def topic_chunk_scores(lecture_id: str, lookups: dict, db_path=None) -> dict:
+    """
+    Score a lecture's chunks against weighted index entries ({topic: weight},
+    see salience.topic_lookups) with indexed lookups only. Returns {position: score}.
+    """
+    if not lookups:
+        return {}
+    conn = get_connection(db_path)
+    rows = conn.execute(f'''SELECT topic, position, weight FROM chunk_topics
+                            WHERE lecture_id = ? AND topic IN ({','.join('?' * len(lookups))})''',
+                        [lecture_id, *lookups]).fetchall()
+    scores = {}
+    for topic, position, weight in rows:
+        scores[position] = scores.get(position, 0) + lookups[topic] * weight
+    return scores
+
+def add_banked_quiz(lecture_id: str, chunk_key: str, quiz: dict, db_path=None):
+    conn = get_connection(db_path)
+    with conn:
+        # Skipped if the lecture was deleted while the quiz was being generated
+        conn.execute('''INSERT INTO quiz_bank (lecture_id, chunk_key, quiz)
+                        SELECT ?, ?, ? WHERE EXISTS (SELECT 1 FROM lectures WHERE id = ?)''',
+                     (lecture_id, chunk_key, json.dumps(quiz, ensure_ascii=False), lecture_id))
+
+def take_banked_quiz(lecture_id: str, chunk_key: str, db_path=None, score=None):
+    """
+    Remove and return a banked quiz for a lecture and chunk set, or None.
+    Without score the oldest is taken; with score (quiz -> float) the
+    best-scoring one, and None if none scores above zero.
+    """
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        # Claim the row under the write lock so two sessions never get the same quiz
+        c.execute('BEGIN IMMEDIATE')
+        rows = c.execute('''SELECT id, quiz FROM quiz_bank
+                             WHERE lecture_id = ? AND chunk_key = ?
+                             ORDER BY id''', (lecture_id, chunk_key)).fetchall()
+        if not rows:
+            return None
+        chosen, quiz = rows[0][0], json.loads(rows[0][1])
+        if score:
+            scored = [(score(json.loads(data)), -row_id, row_id, data) for row_id, data in rows]
+            best, _, chosen, data = max(scored)
+            if best <= 0:
+                return None
+            quiz = json.loads(data)
+        c.execute('DELETE FROM quiz_bank WHERE id = ?', (chosen,))
+    return quiz
+
+def count_banked_quizzes(lecture_id: str, chunk_key: str, db_path=None) -> int:
+    conn = get_connection(db_path)
+    return conn.execute('''SELECT COUNT(*) FROM quiz_bank
+                           WHERE lecture_id = ? AND chunk_key = ?''', (lecture_id, chunk_key)).fetchone()[0]
+
+def get_cached_quiz(key: str, db_path=None):
+    """Cached quiz for a key, or None. A hit refreshes its place in the eviction order."""
+    conn = get_connection(db_path)
+    row = conn.execute('SELECT quiz FROM quiz_cache WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        return None
+    with conn:
+        conn.execute("UPDATE quiz_cache SET last_used = datetime('now') WHERE key = ?", (key,))
+    return json.loads(row[0])
+
+def cache_quiz(key: str, quiz: dict, max_bytes: int, db_path=None):
+    """Store a quiz, then evict least recently used entries until the cache fits in max_bytes"""
+    data = json.dumps(quiz, ensure_ascii=False)
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        c.execute('''INSERT OR REPLACE INTO quiz_cache (key, quiz, size, last_used)
+                     VALUES (?, ?, ?, datetime('now'))''', (key, data, len(data.encode('utf-8'))))
+        excess = c.execute('SELECT COALESCE(SUM(size), 0) FROM quiz_cache').fetchone()[0] - max_bytes
+        if excess <= 0:
+            return
+        evicted, freed = [], 0
+        for old_key, size in c.execute('''SELECT key, size FROM quiz_cache
+                                         WHERE key != ? ORDER BY last_used''', (key,)):
+            if freed >= excess:
+                break
+            evicted.append((old_key,))
+            freed += size
+        c.executemany('DELETE FROM quiz_cache WHERE key = ?', evicted)
+
+def save_chunk_index(lecture_id: str, data: bytes, topic_rows: list = (), db_path=None):
+    """
+    Store a lecture's serialised TF-IDF/salience index (see salience.ChunkIndex)
+    together with the topic-to-chunk rows derived from it
+    """
+    conn = get_connection(db_path)
+    with conn:
+        _insert_topic_rows(conn.cursor(), lecture_id, topic_rows)
+        conn.execute('''INSERT OR REPLACE INTO lecture_tfidf (lecture_id, data)
+                        SELECT ?, ? WHERE EXISTS (SELECT 1 FROM lectures WHERE id = ?)''',
+                     (lecture_id, data, lecture_id))
+
+def load_chunk_index(lecture_id: str, db_path=None):
+    row = get_connection(db_path).execute(
+        'SELECT data FROM lecture_tfidf WHERE lecture_id = ?', (lecture_id,)
+    ).fetchone()
+    return row[0] if row else None
+
+def find_question_signatures(student_id: int, lecture_id: str, bucket_keys: list, db_path=None) -> list:
+    """Signatures sharing at least one LSH bucket with bucket_keys"""
+    conn = get_connection(db_path)
+    return [row[0] for row in conn.execute(f'''
+        SELECT signature FROM question_signatures WHERE id IN
+            (SELECT signature_id FROM question_lsh
+             WHERE student_id = ? AND lecture_id = ? AND bucket IN ({','.join('?' * len(bucket_keys))}))''',
+        [student_id, lecture_id, *bucket_keys])]
+
+def record_question_signatures(student_id: int, lecture_id: str, rows: list, db_path=None):
+    """rows: [(question text, signature bytes, bucket keys)]"""
+    if not rows:
+        return
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        for question, signature, bucket_keys in rows:
+            c.execute('''INSERT INTO question_signatures (student_id, lecture_id, question, signature)
+                         VALUES (?, ?, ?, ?)''', (student_id, lecture_id, question, signature))
+            signature_id = c.lastrowid
+            c.executemany('''INSERT OR IGNORE INTO question_lsh (student_id, lecture_id, bucket, signature_id)
+                             VALUES (?, ?, ?, ?)''',
+                          [(student_id, lecture_id, key, signature_id) for key in bucket_keys])
+
+def log_llm_call(call: dict, db_path=None):
+    """Append one LLM call record (keys as the llm_calls columns, without id and timestamp)"""
+    conn = get_connection(db_path)
+    with conn:
+        conn.execute('''INSERT INTO llm_calls
+                        (call_site, model, prompt_tokens, completion_tokens, latency_ms,
+                         first_token_ms, retries, cache, error)
+                        VALUES (:call_site, :model, :prompt_tokens, :completion_tokens, :latency_ms,
+                                :first_token_ms, :retries, :cache, :error)''', call)
+
+def get_llm_call_stats(since=None, until=None, db_path=None) -> tuple:
+    """
+    Per-call-site aggregates of llm_calls in a time window, computed in SQL.
+    Returns (totals per call site and model, nearest-rank latency percentiles
+    per call site over the calls that reached the model).
+    """
+    conn = get_connection(db_path)
+    where, params = _time_window(since, until)
+    totals = pd.read_sql(f'''SELECT call_site, model, COUNT(*) AS calls,
+                                   SUM(cache = 'hit') AS cache_hits,
+                                   SUM(retries) AS retries, COUNT(error) AS errors,
+                                   SUM(prompt_tokens) AS prompt_tokens,
+                                   SUM(completion_tokens) AS completion_tokens
+                               FROM llm_calls WHERE 1 = 1{where}
+                               GROUP BY call_site, model''', conn, params=params)
+    percentiles = pd.read_sql(f'''
+        WITH live AS (
+            SELECT call_site, latency_ms, first_token_ms,
+                   ROW_NUMBER() OVER (PARTITION BY call_site ORDER BY latency_ms) AS latency_rank,
+                   COUNT(*) OVER (PARTITION BY call_site) AS live_calls,
+                   ROW_NUMBER() OVER (PARTITION BY call_site
+                                      ORDER BY first_token_ms IS NULL, first_token_ms) AS first_token_rank,
+                   COUNT(first_token_ms) OVER (PARTITION BY call_site) AS streamed_calls
+            FROM llm_calls
+            WHERE cache != 'hit'{where})
+        SELECT call_site,
+               MIN(CASE WHEN latency_rank >= 0.5 * live_calls THEN latency_ms END) AS p50_latency_ms,
+               MIN(CASE WHEN latency_rank >= 0.95 * live_calls THEN latency_ms END) AS p95_latency_ms,
+               MIN(CASE WHEN first_token_ms IS NOT NULL AND first_token_rank >= 0.5 * streamed_calls
+                        THEN first_token_ms END) AS p50_first_token_ms
+        FROM live
+        GROUP BY call_site''', conn, params=params)
+    return totals, percentiles
+
+def last_llm_call_id(db_path=None) -> int:
+    """Changes whenever a call is recorded; cheap enough to key a cache on"""
+    return get_connection(db_path).execute('SELECT COALESCE(MAX(id), 0) FROM llm_calls').fetchone()[0]
+
+def _remove_chunks(c, lecture_id: str):
+    # A contentless index needs the original text to delete entries
+    _index_chunks(c, lecture_id, _read_chunks(c, lecture_id), command='delete')
+    c.execute('DELETE FROM lecture_chunks WHERE lecture_id = ?', (lecture_id,))
+    c.execute('DELETE FROM lecture_chunk_blobs WHERE lecture_id = ?', (lecture_id,))
+
+def _insert_lecture(c, lecture: dict) -> bool:
+    c.execute('''INSERT OR IGNORE INTO lectures (id, title, upload_date, file_name, vector_store_path, tags)
+                 VALUES (?, ?, ?, ?, ?, ?)''',
+              (lecture['id'], lecture['title'], lecture.get('upload_date'), lecture.get('file_name'),
+               lecture.get('vector_store_path'), json.dumps(lecture.get('tags', []))))
+    if c.rowcount == 0:
+        # Already present, e.g. imported by another process
+        return False
+    chunks = lecture.get('chunks', [])
+    # Chunk rows carry only the position; the text lives in the lecture's compressed blob
+    c.executemany('''INSERT INTO lecture_chunks (lecture_id, position)
+                     VALUES (?, ?)''', [(lecture['id'], i) for i in range(len(chunks))])
+    _store_blob(c, lecture['id'], chunks)
+    _index_chunks(c, lecture['id'], chunks)
+    return True
+
+def save_lecture(lecture: dict, db_path=None):
+    """Insert a lecture record with its chunks (a list of strings) in one transaction"""
+    conn = get_connection(db_path)
+    with conn:
+        _insert_lecture(conn.cursor(), lecture)
+
+def import_lectures(lectures: list, db_path=None) -> int:
+    """Bulk insert lecture records in one transaction, skipping ids that already exist"""
+    conn = get_connection(db_path)
     c = conn.cursor()
+    with conn:
+        return sum(_insert_lecture(c, lecture) for lecture in lectures)
 
-    # Save lecture main information
-    c.execute('''INSERT INTO lectures (title, file_name, vector_store_path, tags)
-                 VALUES (?, ?, ?, ?)''', 
-              (title, file_name, vector_store_path, ','.join(tags)))
-    lecture_id = c.lastrowid
-    
-    # Save chunks
-    for chunk in chunks:
-        c.execute('''INSERT INTO lecture_chunks (lecture_id, chunk_content)
-                     VALUES (?, ?)''', 
-                  (lecture_id, chunk.page_content))
-    
-    conn.commit()
-    conn.close()
+def _lecture_from_row(c, row) -> dict:
+    lecture_id, title, upload_date, file_name, vector_store_path, tags = row
+    return {
+        'id': lecture_id,
+        'title': title,
+        'upload_date': upload_date,
+        'file_name': file_name,
+        'chunks': _read_chunks(c, lecture_id),
+        'tags': json.loads(tags) if tags else [],
+        'vector_store_path': vector_store_path
+    }
+
+def get_lecture(lecture_id: str, db_path=None):
+    # One read transaction so the record and its chunks come from the same snapshot
+    with read_snapshot(get_connection(db_path)) as c:
+        c.execute('''SELECT id, title, upload_date, file_name, vector_store_path, tags
+                     FROM lectures WHERE id = ?''', (lecture_id,))
+        row = c.fetchone()
+        return _lecture_from_row(c, row) if row else None
+
+def get_all_lectures(db_path=None) -> list:
+    with read_snapshot(get_connection(db_path)) as c:
+        rows = c.execute('''SELECT id, title, upload_date, file_name, vector_store_path, tags
+                            FROM lectures ORDER BY rowid''').fetchall()
+        return [_lecture_from_row(c, row) for row in rows]
+
+def list_lectures(db_path=None, lecture_ids: list = None) -> list:
+    """
+    Lecture metadata with chunk counts, without loading any chunk text.
+    With lecture_ids, only those lectures (still in catalogue order).
+    """
+    conn = get_connection(db_path)
+    where, params = '', []
+    if lecture_ids is not None:
+        where, params = f"WHERE l.id IN ({','.join('?' * len(lecture_ids))})", list(lecture_ids)
+    rows = conn.execute(f'''
+    SELECT l.id, l.title, l.upload_date, l.file_name, l.vector_store_path, l.tags,
+           (SELECT COUNT(*) FROM lecture_chunks lc WHERE lc.lecture_id = l.id) AS chunk_count
+    FROM lectures l
+    {where}
+    ORDER BY l.rowid
+    ''', params).fetchall()
+    return [{
+        'id': lecture_id,
+        'title': title,
+        'upload_date': upload_date,
+        'file_name': file_name,
+        'vector_store_path': vector_store_path,
+        'tags': json.loads(tags) if tags else [],
+        'chunk_count': chunk_count
+    } for lecture_id, title, upload_date, file_name, vector_store_path, tags, chunk_count in rows]
+
+def get_lecture_chunks(lecture_id: str, db_path=None) -> list:
+    conn = get_connection(db_path)
+    chunks = _read_chunks(conn.cursor(), lecture_id)
+    return chunks
+
+def chunk_storage_stats(db_path=None) -> dict:
+    """
+    Storage ratio of the compressed chunk blobs and how fast they decode.
+    Decodes every lecture, so it is meant for the maintenance view, not page loads.
+    """
+    conn = get_connection(db_path)
+    rows = conn.execute('SELECT codec, raw_size, data FROM lecture_chunk_blobs').fetchall()
+    raw = sum(raw_size or 0 for _, raw_size, _ in rows)
+    stored = sum(len(data) for _, _, data in rows)
+    start = time.perf_counter()
+    for codec, _, data in rows:
+        chunk_codec.decode_chunks(codec, data)
+    elapsed = time.perf_counter() - start
+    return {
+        'lectures': len(rows),
+        'codecs': sorted({codec for codec, _, _ in rows}),
+        'raw_bytes': raw,
+        'stored_bytes': stored,
+        'ratio': raw / stored if stored else 0.0,
+        'decode_mb_per_s': raw / elapsed / 1e6 if elapsed else 0.0
+    }
+
+def count_lectures(db_path=None) -> int:
+    conn = get_connection(db_path)
+    return conn.execute('SELECT COUNT(*) FROM lectures').fetchone()[0]
+
+def delete_lecture(lecture_id: str, db_path=None) -> bool:
+    """Delete a lecture and its chunks. Returns False if the id was unknown."""
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        _remove_chunks(c, lecture_id)
+        c.execute('DELETE FROM lectures WHERE id = ?', (lecture_id,))
+        deleted = c.rowcount > 0
+    return deleted
+
+def delete_lectures(lecture_ids: list, db_path=None) -> list:
+    """
+    Delete many lectures in one transaction.
+    Returns the vector store paths of the lectures that were removed.
+    """
+    params = [(lecture_id,) for lecture_id in lecture_ids]
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        c.execute('BEGIN IMMEDIATE')
+        store_paths = []
+        for (lecture_id,) in params:
+            row = c.execute('SELECT vector_store_path FROM lectures WHERE id = ?', (lecture_id,)).fetchone()
+            if row:
+                store_paths.append(row[0])
+                _remove_chunks(c, lecture_id)
+        c.executemany('DELETE FROM lectures WHERE id = ?', params)
+    return store_paths
+
+def update_lecture_tags(lecture_ids: list, add_tags=(), remove_tags=(), replace_tags=None, db_path=None) -> int:
+    """
+    Change the tags of many lectures in one transaction.
+    With replace_tags every lecture gets exactly that list; otherwise
+    add_tags are appended and remove_tags dropped, keeping other tags.
+    Returns the number of lectures updated.
+    """
+    conn = get_connection(db_path)
+    with conn:
+        c = conn.cursor()
+        # Take the write lock before reading so no other writer changes tags in between
+        c.execute('BEGIN IMMEDIATE')
+        updates = []
+        for lecture_id in lecture_ids:
+            row = c.execute('SELECT tags FROM lectures WHERE id = ?', (lecture_id,)).fetchone()
+            if not row:
+                continue
+            if replace_tags is not None:
+                tags = list(replace_tags)
+            else:
+                tags = [t for t in (json.loads(row[0]) if row[0] else []) if t not in remove_tags]
+                tags += [t for t in add_tags if t not in tags]
+            updates.append((json.dumps(tags), lecture_id))
+        c.executemany('UPDATE lectures SET tags = ? WHERE id = ?', updates)
+    return len(updates)
 
-def get_lecture(lecture_id: int):
-    db_path = Path(__file__).parent.parent / "data" / "progress.db"
-    conn = sqlite3.connect(db_path)
+def _fts_query(query: str) -> str:
+    """Quote each search term so user input cannot inject FTS syntax; the last term matches as a prefix"""
+    terms = re.findall(r"\w+", query)
+    if not terms:
+        return ""
+    return " ".join(f'"{t}"' for t in terms) + "*"
+
+def _snippet(text: str, terms: list, width: int = 160) -> str:
+    """Excerpt around the first matching term, with matches in bold"""
+    if not terms:
+        return text[:width]
+    pattern = re.compile(r"(?<!\w)(" + "|".join(re.escape(t) for t in terms) + r")\w*", re.IGNORECASE)
+    m = pattern.search(text)
+    start = max(0, m.start() - width // 3) if m else 0
+    end = min(len(text), start + width)
+    excerpt = pattern.sub(lambda hit: f"**{hit.group(0)}**", text[start:end])
+    return ("…" if start > 0 else "") + excerpt + ("…" if end < len(text) else "")
+
+# Lecture search ranks by where a lecture matched first, and by BM25 only within a tier
+_MATCH_TIERS = {'content': 0, 'tag': 1, 'title': 2}
+
+def search_lectures(query: str, limit: int = 20, db_path=None) -> dict:
+    """
+    Ranked lecture and chunk hits for a search query.
+
+    Lectures are matched on title (full-text), tag (prefix, via the tag index)
+    and chunk content (full-text, BM25). Title hits rank above tag hits,
+    which rank above content-only hits; within a tier, by best chunk score.
+    A query without any word characters only matches tags.
+
+    Returns:
+        {"lectures": [{id, title, tags, chunk_count, ..., match, score, snippet}],
+         "chunks": [{lecture_id, title, position, snippet, score}]}
+    """
+    query = query.strip()
+    if not query:
+        return {"lectures": list_lectures(db_path), "chunks": []}
+
+    conn = get_connection(db_path)
     c = conn.cursor()
-    
-    # Get lecture information
-    c.execute('''SELECT title, file_name, vector_store_path, tags
-                 FROM lectures WHERE id = ?''', (lecture_id,))
-    lecture = c.fetchone()
-    
-    if lecture:
-        title, file_name, vector_store_path, tags = lecture
-        
-        # Get chunks
-        c.execute('''SELECT chunk_content FROM lecture_chunks
-                     WHERE lecture_id = ?''', (lecture_id,))
-        chunks = [row[0] for row in c.fetchall()]
-        
-        conn.close()
-        return {
-            'title': title,
-            'file_name': file_name,
-            'vector_store_path': vector_store_path,
-            'tags': tags.split(',') if tags else [],
-            'chunks': chunks
-        }
-    
-    conn.close()
-    return None
\ No newline at end of file
+    # Best tier each lecture matched in, and the score of its best chunk
+    tiers, scores, snippets = {}, {}, {}
+    like = query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    for (lecture_id,) in c.execute("SELECT lecture_id FROM lecture_tags WHERE tag LIKE ? ESCAPE '\\'", (like,)):
+        tiers[lecture_id] = max(tiers.get(lecture_id, 0), _MATCH_TIERS['tag'])
+
+    terms = re.findall(r"\w+", query)
+    match = _fts_query(query)
+    rows = []
+    try:
+        if match:
+            for (lecture_id,) in c.execute('''SELECT lecture_id FROM lecture_title_fts
+                                             WHERE lecture_title_fts MATCH ?''', (match,)):
+                tiers[lecture_id] = _MATCH_TIERS['title']
+            rows = c.execute('''
+            SELECT lc.lecture_id, l.title, lc.position, hits.rank
+            FROM (SELECT rowid, rank FROM chunk_fts
+                  WHERE chunk_fts MATCH ?
+                  ORDER BY rank
+                  LIMIT ?) hits
+            JOIN lecture_chunks lc ON lc.id = hits.rowid
+            JOIN lectures l ON l.id = lc.lecture_id
+            ORDER BY hits.rank
+            ''', (match, limit * 5)).fetchall()
+    except sqlite3.OperationalError:
+        # No FTS5: decompress and scan every lecture
+        needle = query.lower()
+        rows = []
+        for lecture_id, title in c.execute('SELECT id, title FROM lectures').fetchall():
+            if needle in (title or '').lower():
+                tiers[lecture_id] = _MATCH_TIERS['title']
+            for position, chunk in enumerate(_read_chunks(c, lecture_id)):
+                if needle in chunk.lower() and len(rows) < limit * 5:
+                    rows.append((lecture_id, title, position, 0))
+        terms = [query]
+
+    # Snippets come from the decompressed chunks of the lectures that matched
+    decoded = {}
+    chunk_hits = []
+    for lecture_id, title, position, rank in rows:
+        if lecture_id not in decoded:
+            decoded[lecture_id] = _read_chunks(c, lecture_id)
+        chunks = decoded[lecture_id]
+        snippet = _snippet(chunks[position], terms) if position < len(chunks) else ""
+        # FTS5 rank (bm25) is lower-is-better and negative; flip it into a positive score
+        score = -rank
+        chunk_hits.append({
+            "lecture_id": lecture_id,
+            "title": title,
+            "position": position,
+            "snippet": snippet,
+            "score": score
+        })
+        if lecture_id not in snippets:
+            snippets[lecture_id] = snippet
+            scores[lecture_id] = score
+            tiers.setdefault(lecture_id, _MATCH_TIERS['content'])
+
+    tier_names = {tier: name for name, tier in _MATCH_TIERS.items()}
+    ranked = sorted(tiers, key=lambda lecture_id: (-tiers[lecture_id], -scores.get(lecture_id, 0)))[:limit]
+    # Metadata of the hits only, not the whole catalogue
+    catalogue = {lecture["id"]: lecture for lecture in list_lectures(db_path, ranked)}
+    lectures = [
+        {**catalogue[lecture_id],
+         "match": tier_names[tiers[lecture_id]],
+         "score": scores.get(lecture_id, 0),
+         "snippet": snippets.get(lecture_id, "")}
+        for lecture_id in ranked
+        if lecture_id in catalogue
+    ]
+    return {"lectures": lectures, "chunks": chunk_hits[:limit]}
+
+def set_vector_store_path(lecture_ids: list, new_path: str, db_path=None) -> int:
+    """Point the given lectures at a vector store. Returns the number of lectures updated."""
+    if not lecture_ids:
+        return 0
+    conn = get_connection(db_path)
+    with conn:
+        return conn.execute(f'''UPDATE lectures SET vector_store_path = ?
+                                 WHERE id IN ({','.join('?' * len(lecture_ids))})''',
+                            [new_path, *lecture_ids]).rowcount
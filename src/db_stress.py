@@ -0,0 +1,92 @@
+"""
+Multi-process stress test for LectureDB and TagDB.
+
+Several worker processes save, read and delete lectures and add tags
+against the same database files at once, then the results are checked
+for lost or corrupted writes.
+
+Usage:
+    python src/db_stress.py --processes 8 --lectures 50
+"""
+import argparse
+import sqlite3
+import tempfile
+import time
+from multiprocessing import Pool
+from pathlib import Path
+
+from ingestion import LectureDB, TagDB
+
+
+def _worker(args):
+    worker_id, lectures, db_path, json_path, tags_path = args
+    lecture_db = LectureDB(db_path=db_path, json_path=json_path)
+    tag_db = TagDB(db_path=tags_path)
+    kept = []
+    for i in range(lectures):
+        chunks = [f"worker {worker_id} lecture {i} chunk {j} " * 20 for j in range(10)]
+        lecture_id = lecture_db.save_lecture(
+            title=f"w{worker_id}-{i}",
+            file_name=f"w{worker_id}-{i}.txt",
+            chunks=chunks,
+            tags=[f"tag-{worker_id}"]
+        )
+        lecture = lecture_db.get_lecture(lecture_id)
+        assert lecture and lecture["chunks"] == chunks, f"Lecture {lecture_id} read back incorrectly"
+        # Delete every other lecture so deletes interleave with other workers' saves
+        if i % 2:
+            assert lecture_db.delete_lecture(lecture_id)
+        else:
+            kept.append(lecture_id)
+        tag_db.add_tag(f"tag-{worker_id}-{i}")
+    return kept
+
+
+def run(processes: int, lectures: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "progress.db"
+        json_path = Path(tmp) / "lectures_db.json"
+        tags_path = Path(tmp) / "tags_db.json"
+        TagDB(db_path=tags_path).save_tags([])
+
+        start = time.perf_counter()
+        with Pool(processes) as pool:
+            results = pool.map(
+                _worker,
+                [(w, lectures, db_path, json_path, tags_path) for w in range(processes)]
+            )
+        elapsed = time.perf_counter() - start
+
+        expected = {lecture_id for kept in results for lecture_id in kept}
+        lecture_db = LectureDB(db_path=db_path, json_path=json_path)
+        stored = {lecture["id"] for lecture in lecture_db.list_lectures()}
+        tags = TagDB(db_path=tags_path).load_tags()
+        expected_tags = {f"tag-{w}-{i}" for w in range(processes) for i in range(lectures)}
+
+        conn = sqlite3.connect(db_path)
+        integrity = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        orphan_chunks = conn.execute(
+            "SELECT COUNT(*) FROM lecture_chunks WHERE lecture_id NOT IN (SELECT id FROM lectures)"
+        ).fetchone()[0]
+        conn.close()
+
+        return {
+            "operations": processes * lectures,
+            "seconds": round(elapsed, 2),
+            "lectures_ok": stored == expected,
+            "tags_ok": set(tags) == expected_tags and len(tags) == len(expected_tags),
+            "integrity": integrity,
+            "orphan_chunks": orphan_chunks,
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent LectureDB/TagDB stress test")
+    parser.add_argument("--processes", type=int, default=8)
+    parser.add_argument("--lectures", type=int, default=50)
+    args = parser.parse_args()
+
+    report = run(args.processes, args.lectures)
+    print(report)
+    if not (report["lectures_ok"] and report["tags_ok"] and report["integrity"] == "ok" and not report["orphan_chunks"]):
+        raise SystemExit("Stress test failed")
@@ -0,0 +1,56 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Most points a chart is given, whatever the length of the history
+CHART_POINT_BUDGET = int(os.getenv("CHART_POINT_BUDGET") or 500)
+
+
+def lttb(x, y, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last point and, from each of n_out - 2 equal-size
+    buckets in between, the point forming the largest triangle with the
+    point kept before it and the mean of the next bucket. Work inside a
+    bucket is vectorised, so the Python loop runs n_out times whatever the
+    input size.
+
+    Returns the indices of the kept points, in order.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    buckets = n_out - 2
+    bounds = np.linspace(1, n - 1, buckets + 1).astype(int)
+    starts, ends = bounds[:-1], bounds[1:]
+    counts = ends - starts
+    # Mean of every bucket at once; the last bucket looks ahead to the final point
+    mean_x = np.append(np.add.reduceat(x[1:n - 1], starts - 1) / counts, x[-1])
+    mean_y = np.append(np.add.reduceat(y[1:n - 1], starts - 1) / counts, y[-1])
+
+    kept = np.empty(n_out, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for i in range(buckets):
+        bx, by = x[starts[i]:ends[i]], y[starts[i]:ends[i]]
+        cx, cy = mean_x[i + 1], mean_y[i + 1]
+        area = np.abs((x[a] - cx) * (by - y[a]) - (x[a] - bx) * (cy - y[a]))
+        a = starts[i] + int(np.argmax(area))
+        kept[i + 1] = a
+    return kept
+
+
+def downsample_progress(progress_df: pd.DataFrame, max_points: int = None) -> pd.DataFrame:
+    """Reduce a progress frame to at most max_points rows (default CHART_POINT_BUDGET) for plotting"""
+    max_points = max_points or CHART_POINT_BUDGET
+    if len(progress_df) <= max_points:
+        return progress_df
+    x = pd.to_datetime(progress_df['timestamp']).astype('int64')
+    kept = lttb(x.to_numpy(), progress_df['score'].to_numpy(), max_points)
+    return progress_df.iloc[kept].reset_index(drop=True)
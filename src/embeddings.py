@@ -0,0 +1,97 @@
+import os
+import re
+import json
+import math
+import hashlib
+from pathlib import Path
+from typing import List, Union
+
+from langchain_core.embeddings import Embeddings
+
+
+BACKEND_MANIFEST = "embedding_backend.json"
+DEFAULT_BACKEND = os.getenv("EMBEDDING_BACKEND", "openai")
+SENTENCE_MODEL = os.getenv("SENTENCE_EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2")
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic feature-hashing embeddings.
+    No model, no network: the same text always maps to the same vector,
+    which makes it suitable for tests and air-gapped installs.
+    """
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def _tokens(self, text: str) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        # Unigrams plus bigrams keep a little word order information
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in self._tokens(text):
+            digest = hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm:
+            vector = [v / norm for v in vector]
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed(text)
+
+
+def get_embeddings(backend: str = None, openai_api_key: str = None) -> Embeddings:
+    """
+    Build the embedding model for a backend name
+
+    Args:
+        backend: One of "openai", "sentence-transformers" or "hashing"
+        openai_api_key: Only used by the "openai" backend
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == "openai":
+        from langchain_community.embeddings import OpenAIEmbeddings
+        return OpenAIEmbeddings(openai_api_key=openai_api_key)
+    elif backend == "sentence-transformers":
+        try:
+            from langchain_community.embeddings import HuggingFaceEmbeddings
+        except ImportError as e:
+            raise ValueError(f"sentence-transformers backend is not available: {str(e)}")
+        # Only use models already present in the local cache
+        return HuggingFaceEmbeddings(
+            model_name=SENTENCE_MODEL,
+            model_kwargs={"device": "cpu", "local_files_only": True},
+            encode_kwargs={"normalize_embeddings": True}
+        )
+    elif backend == "hashing":
+        return HashingEmbeddings()
+    else:
+        raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def backend_signature(backend: str) -> str:
+    """Name recorded with a store, including the model where it matters."""
+    if backend == "sentence-transformers":
+        return f"{backend}:{SENTENCE_MODEL}"
+    return backend
+
+
+def write_backend_manifest(path: Union[str, Path], backend: str) -> None:
+    with open(Path(path) / BACKEND_MANIFEST, "w") as f:
+        json.dump({"backend": backend_signature(backend)}, f)
+
+
+def read_backend_manifest(path: Union[str, Path]) -> str:
+    """Return the backend that built a store. Stores saved before manifests existed used OpenAI."""
+    manifest = Path(path) / BACKEND_MANIFEST
+    if not manifest.exists():
+        return "openai"
+    with open(manifest, "r") as f:
+        return json.load(f)["backend"]
@@ -10,6 +10,11 @@ from PIL import Image
 import pytesseract
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 import os
+import tempfile
+from filelock import FileLock
+
+import database
+from salience import ChunkIndex, topic_links, topic_lookups
 
 
 # ===== Lecture Notes Ingestion =====
@@ -80,10 +85,35 @@ class LectureNotesIngester:
         return self.text_splitter.split_text(cleaned_text)
 
 class LectureDB:
-    def __init__(self):
-        self.db_path = os.path.join(os.path.dirname(__file__), "../data/lectures_db.json")
-        os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
-    
+    """
+    Lecture records and their chunks, stored in the indexed SQLite
+    lecture tables of progress.db. Lectures from the old lectures_db.json
+    are imported once on first use.
+    """
+    def __init__(self, db_path=None, json_path=None):
+        self.db_path = Path(db_path) if db_path else database.DB_PATH
+        self.json_path = Path(json_path) if json_path else Path(__file__).parent.parent / "data" / "lectures_db.json"
+        database.init_db(self.db_path)
+        self._migrate_json()
+
+    def _migrate_json(self):
+        """One-time import of lectures_db.json; the file is renamed afterwards so it is not read again"""
+        if not self.json_path.exists():
+            return
+        try:
+            with open(self.json_path, "r", encoding="utf-8") as f:
+                lectures = json.load(f)
+        except FileNotFoundError:
+            return
+        except json.JSONDecodeError:
+            lectures = []
+        database.import_lectures(lectures, self.db_path)
+        try:
+            self.json_path.rename(self.json_path.with_name(self.json_path.name + ".migrated"))
+        except FileNotFoundError:
+            # Another process finished the migration first
+            pass
+
     def save_lecture(self, title: str, file_name: str, chunks: list, tags: list = [], vector_store_path: str = None):
         """
         Save lecture information to the database
@@ -106,69 +136,131 @@ class LectureDB:
                     # If it is already a string, use it directly.
                     serializable_chunks.append(chunk)
 
-            if not os.path.exists(self.db_path):
-                with open(self.db_path, "w") as f:
-                    json.dump([], f)
-
-            with open(self.db_path, "r+") as f:
-                try:
-                    lectures = json.load(f)
-                except json.JSONDecodeError:
-                    lectures = []
-                
-                lectures.append({
-                    "id": str(uuid.uuid4()),
-                    "title": title,
-                    "upload_date": datetime.now().strftime("%Y-%m-%d"),
-                    "file_name": file_name,
-                    "chunks": serializable_chunks, 
-                    "tags": tags,
-                    "vector_store_path": vector_store_path
-                })
-                
-                f.seek(0)
-                json.dump(lectures, f, ensure_ascii=False, indent=2)
-                f.truncate()
+            lecture_id = str(uuid.uuid4())
+            database.save_lecture({
+                "id": lecture_id,
+                "title": title,
+                "upload_date": datetime.now().strftime("%Y-%m-%d"),
+                "file_name": file_name,
+                "chunks": serializable_chunks, 
+                "tags": tags,
+                "vector_store_path": vector_store_path
+            }, self.db_path)
+            self._build_chunk_index(lecture_id, serializable_chunks)
+            return lecture_id
                 
         except Exception as e:
             print(f"Error saving lecture: {str(e)}")
             raise
     
     def get_lecture(self, lecture_id: str):
-        with open(self.db_path, "r") as f:
-            lectures = json.load(f)
-            return next((lec for lec in lectures if lec["id"] == lecture_id), None)
+        return database.get_lecture(lecture_id, self.db_path)
     
+    def list_lectures(self):
+        """
+        Lightweight catalogue: id, title, tags, chunk_count, upload_date,
+        file_name and vector_store_path for every lecture, without chunk text
+        """
+        try:
+            return database.list_lectures(self.db_path)
+        except Exception as e:
+            print(f"Error reading lectures: {str(e)}")
+            return []
+
+    def search(self, query: str, limit: int = 20) -> dict:
+        """Ranked lecture and chunk hits with snippets; see database.search_lectures"""
+        return database.search_lectures(query, limit, self.db_path)
+
+    def get_chunks(self, lecture_id: str) -> list:
+        """Chunk texts of one lecture, in document order"""
+        return database.get_lecture_chunks(lecture_id, self.db_path)
+
+    def _build_chunk_index(self, lecture_id: str, chunks: list) -> ChunkIndex:
+        index = ChunkIndex.build(chunks)
+        database.save_chunk_index(lecture_id, index.to_bytes(), index.topic_rows(), self.db_path)
+        return index
+
+    def chunk_index(self, lecture_id: str) -> ChunkIndex:
+        """
+        Stored TF-IDF matrix and salience scores of a lecture. Lectures saved
+        before indexes existed (or imported) are indexed on first use.
+        """
+        data = database.load_chunk_index(lecture_id, self.db_path)
+        if data is not None:
+            return ChunkIndex.from_bytes(data)
+        return self._build_chunk_index(lecture_id, self.get_chunks(lecture_id))
+
+    def key_chunks(self, lecture_id: str, k: int = 5, measure: str = None, topic_scores: dict = None) -> list:
+        """Positions of the k key chunks by stored salience; see ChunkIndex.key_chunks"""
+        return self.chunk_index(lecture_id).key_chunks(k, measure, topic_scores)
+
+    def search_chunks(self, lecture_id: str, query: str, limit: int = 5) -> list:
+        """[(position, score)] of the lecture's chunks closest to query under its TF-IDF matrix"""
+        return self.chunk_index(lecture_id).search(query, limit)
+
+    def topic_chunk_scores(self, lecture_id: str, topics: dict) -> dict:
+        """{position: score} for the chunks covering the weighted topics ({name: weight})"""
+        return database.topic_chunk_scores(lecture_id, topic_lookups(topics), self.db_path)
+
+    def link_topics(self, lecture_id: str, chunks: dict, topics: list):
+        """Link question topics to the chunks ({position: text}) they were generated from"""
+        database.link_topic_chunks(lecture_id, topic_links(chunks, topics), self.db_path)
+
+    def import_lectures(self, lectures: list) -> int:
+        """Insert complete lecture records (with chunks), skipping ids already present"""
+        return database.import_lectures(lectures, self.db_path)
+
+    def chunk_storage_stats(self) -> dict:
+        """Compression ratio and decode throughput of the stored chunks"""
+        return database.chunk_storage_stats(self.db_path)
+
     def get_all_lectures(self):
         try:
-            if not os.path.exists(self.db_path):
-                return []
-            with open(self.db_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            return database.get_all_lectures(self.db_path)
         except Exception as e:
             print(f"Error reading lectures: {str(e)}")
             return []
         
     def delete_lecture(self, lecture_id: str):
-        """Optimized deletion with direct file overwrite"""
+        """Delete one lecture; touches only its own rows"""
         try:
-            with open(self.db_path, "r+") as f:
-                lectures = json.load(f)
-                new_lectures = [lec for lec in lectures if lec["id"] != lecture_id]
-                f.seek(0)
-                json.dump(new_lectures, f, indent=2)
-                f.truncate()
+            database.delete_lecture(lecture_id, self.db_path)
             return True
         except Exception as e:
             print(f"Delete error: {str(e)}")
             return False
+
+    def delete_lectures(self, lecture_ids: list) -> list:
+        """
+        Delete many lectures in a single transaction.
+        Returns the vector store paths of the deleted lectures so the caller can release them.
+        """
+        return database.delete_lectures(lecture_ids, self.db_path)
+
+    def retag_lectures(self, lecture_ids: list, add_tags: list = [], remove_tags: list = []) -> int:
+        """Add and/or remove tags on many lectures, keeping their other tags"""
+        return database.update_lecture_tags(lecture_ids, add_tags=add_tags, remove_tags=remove_tags, db_path=self.db_path)
+
+    def move_to_tag(self, lecture_ids: list, tag: str) -> int:
+        """Replace the tags of many lectures with a single tag"""
+        return database.update_lecture_tags(lecture_ids, replace_tags=[tag], db_path=self.db_path)
+
+    def set_vector_store_path(self, lecture_ids: list, new_path: str) -> int:
+        """Point the given lectures at a vector store"""
+        return database.set_vector_store_path(lecture_ids, new_path, self.db_path)
         
 class TagDB:
+    """
+    Tag list kept in a JSON file. Writes take an inter-process lock and
+    replace the file atomically, so concurrent sessions never see a
+    half-written file.
+    """
     def __init__(self, db_path=None):
         if db_path is None:
             self.db_path = Path(__file__).parent.parent / "data" / "tags_db.json"
         else:
             self.db_path = Path(db_path)
+        self.lock = FileLock(str(self.db_path) + ".lock", timeout=30)
         self._initialize_db()
     
     def _initialize_db(self):
@@ -190,7 +282,38 @@ class TagDB:
                 return json.load(f)
         except (FileNotFoundError, json.JSONDecodeError):
             return []
+
+    def _write(self, tags):
+        # Write to a temporary file in the same directory, then rename over the original
+        fd, tmp_path = tempfile.mkstemp(dir=self.db_path.parent, prefix=self.db_path.name, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w") as f:
+                json.dump(tags, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.db_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
     
     def save_tags(self, tags):
-        with open(self.db_path, "w") as f:
-            json.dump(tags, f, indent=2)
\ No newline at end of file
+        with self.lock:
+            self._write(tags)
+
+    def add_tag(self, tag):
+        """Add a tag under the lock so concurrent additions are not lost"""
+        with self.lock:
+            tags = self.load_tags()
+            if tag not in tags:
+                tags.append(tag)
+                self._write(tags)
+            return tags
+
+    def remove_tag(self, tag):
+        with self.lock:
+            tags = self.load_tags()
+            if tag in tags:
+                tags.remove(tag)
+                self._write(tags)
+            return tags
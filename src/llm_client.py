@@ -0,0 +1,232 @@
+"""
+Shared LLM clients.
+
+Every OpenAI call goes through one process-wide httpx connection pool, so
+connections and TLS sessions are reused across quiz generation, chat and
+reruns. Clients are cached per key and model; all of them share the same
+timeouts and bounded retries (the SDK retries connection errors, 429s and
+5xx with exponential backoff).
+
+Async clients live on one background event loop (run_async), so their
+pooled connections also outlive a single batch of concurrent calls.
+
+Both pools count HTTP attempts for llm_telemetry, so retries show up
+in the per-call records.
+
+Set LLM_FAKE=1 to answer every request locally with canned
+OpenAI-compatible responses, for offline runs and tests.
+"""
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import threading
+
+import httpx
+from openai import OpenAI, AsyncOpenAI
+from langchain_openai import ChatOpenAI
+
+import llm_telemetry
+
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT") or 60)
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT") or 5)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES") or 2)
+FAKE_LLM = (os.getenv("LLM_FAKE") or "").lower() in ("1", "true", "yes")
+
+_lock = threading.Lock()
+_http_client = None
+_openai_clients = {}
+_chat_models = {}
+_loop = None
+_async_http_client = None
+_async_openai_clients = {}
+
+
+# ===== Fake server =====
+def _fake_quiz(prompt: str) -> dict:
+    """Canned quiz built from the request, so different texts give different questions"""
+    match = re.search(r"Generate (\d+) quiz questions", prompt)
+    count = int(match.group(1)) if match else 5
+    text = prompt.split("=== TEXT TO PROCESS ===", 1)[-1]
+    words = re.findall(r"[A-Za-z]{4,}", text) or ["topic"]
+    questions = []
+    for i in range(count):
+        phrase = " ".join(words[(i * 4 + j) % len(words)] for j in range(4))
+        questions.append({
+            "question": f"Offline question {i + 1}: what does '{phrase}' refer to?",
+            "options": ["Option A", "Option B", "Option C", "Option D"],
+            "answer": "Option A",
+            "explanation": "Canned answer from the offline LLM server.",
+            "topic": words[(i * 4) % len(words)].lower()
+        })
+    return {"questions": questions}
+
+
+def _fake_handler(request: httpx.Request) -> httpx.Response:
+    """Answer chat completion requests the way the OpenAI API would"""
+    if not request.url.path.endswith("/chat/completions"):
+        return httpx.Response(404, json={"error": {"message": "Not supported by the fake LLM server"}})
+    body = json.loads(request.content or b"{}")
+    if (body.get("response_format") or {}).get("type") == "json_object":
+        content = json.dumps(_fake_quiz(str(body.get("messages", [{}])[-1].get("content", ""))))
+    else:
+        content = "This is an offline reply from the fake LLM server."
+    prompt_tokens = sum(len(str(m.get("content", "")).split()) for m in body.get("messages", []))
+    completion_tokens = len(content.split())
+    usage = {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+    if body.get("stream"):
+        return _fake_stream(body, content, usage)
+    return httpx.Response(200, json={
+        "id": f"chatcmpl-fake-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": usage
+    })
+
+
+def _fake_stream(body: dict, content: str, usage: dict) -> httpx.Response:
+    """Server-sent events carrying content a few characters at a time"""
+    completion_id = f"chatcmpl-fake-{uuid.uuid4().hex}"
+    events = []
+    for start in range(0, len(content), 16):
+        events.append({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {"content": content[start:start + 16]}, "finish_reason": None}]
+        })
+    events.append({
+        "id": completion_id,
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": body.get("model", "fake"),
+        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+    })
+    if (body.get("stream_options") or {}).get("include_usage"):
+        events.append({
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [],
+            "usage": usage
+        })
+    payload = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+    return httpx.Response(200, headers={"content-type": "text/event-stream"}, content=payload.encode("utf-8"))
+
+
+# ===== Clients =====
+def get_http_client() -> httpx.Client:
+    """Process-wide keep-alive connection pool"""
+    global _http_client
+    with _lock:
+        if _http_client is None:
+            _http_client = httpx.Client(
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                transport=httpx.MockTransport(_fake_handler) if FAKE_LLM else None,
+                event_hooks={"request": [llm_telemetry.count_attempt]}
+            )
+        return _http_client
+
+
+def _resolve_key(api_key: str = None) -> str:
+    api_key = api_key or os.getenv("OPENAI_API_KEY")
+    if FAKE_LLM:
+        return api_key or "fake-key"
+    return api_key
+
+
+def get_openai_client(api_key: str = None, base_url: str = None) -> OpenAI:
+    """Shared OpenAI SDK client for a key (and optional OpenAI-compatible base_url)"""
+    api_key = _resolve_key(api_key)
+    http_client = get_http_client()
+    with _lock:
+        key = (api_key, base_url)
+        if key not in _openai_clients:
+            _openai_clients[key] = OpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client
+            )
+        return _openai_clients[key]
+
+
+def get_chat_model(api_key: str = None, model: str = "gpt-4o", temperature: float = 0.3,
+                   timeout: float = None) -> ChatOpenAI:
+    """Shared LangChain chat model, built once per key, model, temperature and timeout"""
+    api_key = _resolve_key(api_key)
+    http_client = get_http_client()
+    with _lock:
+        key = (api_key, model, temperature, timeout)
+        if key not in _chat_models:
+            _chat_models[key] = ChatOpenAI(
+                api_key=api_key,
+                model_name=model,
+                temperature=temperature,
+                timeout=timeout or LLM_TIMEOUT,
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client
+            )
+        return _chat_models[key]
+
+
+# ===== Async =====
+def _event_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="llm-event-loop", daemon=True).start()
+        return _loop
+
+
+def run_async(coro, timeout: float = None):
+    """Run a coroutine on the shared LLM event loop and wait for its result"""
+    return asyncio.run_coroutine_threadsafe(coro, _event_loop()).result(timeout)
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    global _async_http_client
+    with _lock:
+        if _async_http_client is None:
+            _async_http_client = httpx.AsyncClient(
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                limits=httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=60),
+                transport=httpx.MockTransport(_fake_handler) if FAKE_LLM else None,
+                event_hooks={"request": [llm_telemetry.count_attempt_async]}
+            )
+        return _async_http_client
+
+
+def get_async_openai_client(api_key: str = None, base_url: str = None) -> AsyncOpenAI:
+    """Shared async OpenAI client. Only use it in coroutines started with run_async."""
+    api_key = _resolve_key(api_key)
+    http_client = _get_async_http_client()
+    with _lock:
+        key = (api_key, base_url)
+        if key not in _async_openai_clients:
+            _async_openai_clients[key] = AsyncOpenAI(
+                api_key=api_key,
+                base_url=base_url,
+                timeout=httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT),
+                max_retries=LLM_MAX_RETRIES,
+                http_client=http_client
+            )
+        return _async_openai_clients[key]
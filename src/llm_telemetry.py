@@ -0,0 +1,156 @@
+"""
+Per-call LLM telemetry.
+
+Every call is wrapped in track(call_site, model), which records latency,
+prompt and completion tokens, retries and cache status to the llm_calls
+table in progress.db. Retries are counted by httpx request hooks on the
+shared clients (see llm_client), so SDK-level retries are included.
+Cache hits that stand in for a call are recorded with record_cache_hit.
+
+Set LLM_TELEMETRY=0 to turn recording off.
+"""
+import os
+import time
+import sqlite3
+import contextvars
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+import database
+
+
+TELEMETRY_ENABLED = (os.getenv("LLM_TELEMETRY") or "1").lower() not in ("0", "false", "no")
+
+# USD per million prompt / completion tokens, for the spend estimate in summarize()
+PRICES = {
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4-0125-preview": (10.0, 30.0),
+    "gpt-4": (30.0, 60.0),
+    "gpt-3.5-turbo": (0.5, 1.5),
+    "gpt-3.5-turbo-0125": (0.5, 1.5),
+}
+
+_current_call = contextvars.ContextVar("llm_call", default=None)
+
+
+class LLMCall:
+    """What is known about one call so far; filled in while it runs"""
+    def __init__(self, call_site: str, model: str, cache: str = "miss"):
+        self.call_site = call_site
+        self.model = model
+        self.cache = cache
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.attempts = 0
+        self.started = time.perf_counter()
+        self.first_token_ms = None
+
+    def set_usage(self, usage):
+        """Token counts from an OpenAI usage object or a LangChain usage_metadata dict"""
+        if usage is None:
+            return
+        if isinstance(usage, dict):
+            self.prompt_tokens = usage.get("input_tokens", usage.get("prompt_tokens"))
+            self.completion_tokens = usage.get("output_tokens", usage.get("completion_tokens"))
+        else:
+            self.prompt_tokens = getattr(usage, "prompt_tokens", None)
+            self.completion_tokens = getattr(usage, "completion_tokens", None)
+
+    def first_token(self):
+        """Mark the arrival of the first streamed content"""
+        if self.first_token_ms is None:
+            self.first_token_ms = (time.perf_counter() - self.started) * 1000
+
+    def record(self, error: str = None):
+        _write({
+            "call_site": self.call_site,
+            "model": self.model,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "latency_ms": (time.perf_counter() - self.started) * 1000,
+            "first_token_ms": self.first_token_ms,
+            "retries": max(self.attempts - 1, 0),
+            "cache": self.cache,
+            "error": error,
+        })
+
+
+@contextmanager
+def track(call_site: str, model: str, cache: str = "miss"):
+    """
+    Record the LLM call made inside the block. cache is "miss" after a failed
+    cache lookup, "bypass" when the cache was skipped on purpose and "none"
+    for calls that are never cached. Errors are recorded and re-raised.
+    """
+    call = LLMCall(call_site, model, cache)
+    token = _current_call.set(call)
+    error = None
+    try:
+        yield call
+    except Exception as e:
+        error = f"{type(e).__name__}: {str(e)[:200]}"
+        raise
+    finally:
+        # Also reached when a streaming consumer stops early
+        _current_call.reset(token)
+        call.record(error)
+
+
+def record_cache_hit(call_site: str, model: str):
+    """A request answered from a cache instead of the model"""
+    LLMCall(call_site, model, cache="hit").record()
+
+
+def _write(record: dict):
+    if not TELEMETRY_ENABLED:
+        return
+    try:
+        database.log_llm_call(record)
+    except sqlite3.Error as e:
+        print(f"LLM telemetry unavailable: {str(e)}")
+
+
+# ===== httpx hooks =====
+def count_attempt(request):
+    """Request hook for the shared httpx client: one call per HTTP attempt"""
+    call = _current_call.get()
+    if call is not None:
+        call.attempts += 1
+
+
+async def count_attempt_async(request):
+    count_attempt(request)
+
+
+# ===== Summary =====
+def _cost(totals: pd.DataFrame) -> pd.Series:
+    prices = totals["model"].map(lambda model: PRICES.get(model, (np.nan, np.nan)))
+    return (totals["prompt_tokens"].fillna(0) * prices.str[0]
+            + totals["completion_tokens"].fillna(0) * prices.str[1]) / 1_000_000
+
+
+def summarize(since=None, until=None, db_path=None) -> pd.DataFrame:
+    """
+    One row per call site: calls, cache hit rate, retries, errors, p50/p95
+    latency of the calls that reached the model, tokens and estimated cost.
+    Aggregated in SQLite; only one row per call site and model reaches pandas.
+    """
+    totals, percentiles = database.get_llm_call_stats(since, until, db_path)
+    if totals.empty:
+        return pd.DataFrame()
+    totals["cost_usd"] = _cost(totals)
+    grouped = totals.groupby("call_site")
+    summary = pd.DataFrame({
+        "calls": grouped["calls"].sum(),
+        "cache_hit_rate": grouped["cache_hits"].sum() / grouped["calls"].sum(),
+        "retries": grouped["retries"].sum(),
+        "errors": grouped["errors"].sum(),
+        "prompt_tokens": grouped["prompt_tokens"].sum(),
+        "completion_tokens": grouped["completion_tokens"].sum(),
+        "cost_usd": grouped["cost_usd"].sum(min_count=1),
+    }).join(percentiles.set_index("call_site"))
+    return summary.sort_values("cost_usd", ascending=False).reset_index()
@@ -0,0 +1,111 @@
+"""
+Synthetic load generator and latency benchmark for the progress dashboard.
+
+Fills a database with many students' quiz history through the normal
+write path (log_quiz_batch, so the rollups are maintained as in the app),
+then times the queries behind Tab 3 for a sample of students.
+
+Usage:
+    python src/progress_bench.py --students 100000 --answers 10000000
+    python src/progress_bench.py --db /tmp/progress_bench.db --skip-generate
+"""
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import database
+
+
+TOPICS = [f"topic-{i}" for i in range(40)]
+
+
+def generate(db_path, students: int, answers: int, questions_per_quiz: int = 5,
+             days: int = 365, batch_size: int = 5000, seed: int = 0) -> dict:
+    """Write about `answers` answered questions spread over `students` students"""
+    rng = random.Random(seed)
+    database.init_db(db_path)
+    quizzes = max(1, answers // questions_per_quiz)
+    start = datetime.utcnow() - timedelta(days=days)
+    span = days * 86400
+
+    # Each student has a fixed skill per topic so weak topics are stable.
+    # Derived from a hash rather than stored: 100k students x 40 topics is a lot of floats.
+    def skill(student_id, topic_index):
+        return 0.3 + 0.65 * (((student_id * 2654435761) ^ (topic_index * 40503 + seed)) % 1000) / 1000
+
+    began = time.perf_counter()
+    batch, written = [], 0
+    for n in range(quizzes):
+        student_id = rng.randint(1, students)
+        questions = []
+        for _ in range(questions_per_quiz):
+            topic_index = rng.randrange(len(TOPICS))
+            topic = TOPICS[topic_index]
+            correct = rng.random() < skill(student_id, topic_index)
+            questions.append({
+                "question": f"Question about {topic}",
+                "answer": "A",
+                "student_answer": "A" if correct else rng.choice("BCD"),
+                "topic": topic
+            })
+        batch.append({
+            "student_id": student_id,
+            "timestamp": (start + timedelta(seconds=rng.randrange(span))).strftime("%Y-%m-%d %H:%M:%S"),
+            "questions": questions
+        })
+        if len(batch) >= batch_size or n == quizzes - 1:
+            written += database.log_quiz_batch(batch, db_path)
+            batch = []
+    return {
+        "quizzes": written,
+        "answers": written * questions_per_quiz,
+        "seconds": round(time.perf_counter() - began, 1)
+    }
+
+
+def _percentiles(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "p50_ms": round(statistics.median(samples) * 1000, 2),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 2),
+        "max_ms": round(samples[-1] * 1000, 2)
+    }
+
+
+def benchmark(db_path, students: int, samples: int = 500, seed: int = 1) -> dict:
+    """Time the dashboard queries for random students, all-time and for the last 30 days"""
+    rng = random.Random(seed)
+    since = (datetime.utcnow() - timedelta(days=30)).strftime("%Y-%m-%d %H:%M:%S")
+    timings = {name: [] for name in ("dashboard_all_time", "dashboard_30_days")}
+    for _ in range(samples):
+        student_id = rng.randint(1, students)
+        for name, window in (("dashboard_all_time", None), ("dashboard_30_days", since)):
+            began = time.perf_counter()
+            database.get_student_summary(student_id, since=window, db_path=db_path)
+            database.get_student_progress(student_id, since=window, db_path=db_path)
+            database.get_weak_topics(student_id, since=window, db_path=db_path)
+            timings[name].append(time.perf_counter() - began)
+    return {name: _percentiles(values) for name, values in timings.items()}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Progress dashboard scale benchmark")
+    parser.add_argument("--students", type=int, default=100000)
+    parser.add_argument("--answers", type=int, default=10000000)
+    parser.add_argument("--questions-per-quiz", type=int, default=5)
+    parser.add_argument("--samples", type=int, default=500)
+    parser.add_argument("--db", help="Database file to fill (default: a temporary file)")
+    parser.add_argument("--skip-generate", action="store_true", help="Benchmark an already generated --db")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(args.db) if args.db else Path(tmp) / "progress.db"
+        if not args.skip_generate:
+            print("generated:", generate(db_path, args.students, args.answers, args.questions_per_quiz))
+        print("size_mb:", round(db_path.stat().st_size / 1e6, 1))
+        for name, stats in benchmark(db_path, args.students, args.samples).items():
+            print(f"{name}:", stats)
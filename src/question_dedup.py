@@ -0,0 +1,97 @@
+import re
+import hashlib
+
+import numpy as np
+
+import database
+
+
+# 64 MinHash permutations in 16 LSH bands of 4 rows: pairs above ~0.5 Jaccard
+# share a band with high probability, pairs far below it rarely do
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+DUPLICATE_THRESHOLD = 0.7
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(1)
+_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+
+
+def _shingles(text: str) -> set:
+    """Word 3-grams (single words for very short texts)"""
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < 3:
+        return set(words)
+    return {" ".join(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def question_text(question: dict) -> str:
+    """What makes two questions the same: the question and its answer"""
+    return f"{question.get('question', '')} {question.get('answer', '')}"
+
+
+def signature(text: str) -> np.ndarray:
+    """MinHash signature (NUM_PERM uint32 values) of a text's shingles"""
+    shingles = _shingles(text) or {""}
+    hashes = np.fromiter(
+        (int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little") for s in shingles),
+        dtype=np.uint64, count=len(shingles)
+    )
+    # (a * x + b) mod p for every permutation and shingle; a, x < 2^32 so nothing overflows
+    permuted = (_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME
+    return permuted.min(axis=1).astype(np.uint32)
+
+
+def band_keys(sig: np.ndarray) -> list:
+    """One signed 64-bit bucket key per LSH band"""
+    return [
+        int.from_bytes(hashlib.blake2b(bytes([band]) + sig[band * ROWS:(band + 1) * ROWS].tobytes(),
+                                       digest_size=8).digest(), "little", signed=True)
+        for band in range(BANDS)
+    ]
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+def find_new_questions(student_id: int, lecture_id: str, questions: list,
+                       threshold: float = DUPLICATE_THRESHOLD, db_path=None):
+    """
+    Drop questions the student has already been given for this lecture (or
+    repeats within the batch), without recording anything. Candidates come
+    from the LSH buckets, so only a handful of stored signatures are compared.
+
+    Returns:
+        (new questions, number rejected as near-duplicates)
+    """
+    kept, batch = [], []
+    for question in questions:
+        sig = signature(question_text(question))
+        candidates = database.find_question_signatures(student_id, lecture_id, band_keys(sig), db_path)
+        seen = [np.frombuffer(data, dtype=np.uint32) for data in candidates] + batch
+        if any(similarity(sig, other) >= threshold for other in seen):
+            continue
+        kept.append(question)
+        batch.append(sig)
+    return kept, len(questions) - len(kept)
+
+
+def record_questions(student_id: int, lecture_id: str, questions: list, db_path=None):
+    """Remember questions as given to the student; only call this for questions actually shown"""
+    rows = []
+    for question in questions:
+        sig = signature(question_text(question))
+        rows.append((question.get("question", ""), sig.tobytes(), band_keys(sig)))
+    database.record_question_signatures(student_id, lecture_id, rows, db_path)
+
+
+def filter_new_questions(student_id: int, lecture_id: str, questions: list,
+                         threshold: float = DUPLICATE_THRESHOLD, db_path=None):
+    """find_new_questions, then record every question kept"""
+    kept, rejected = find_new_questions(student_id, lecture_id, questions, threshold, db_path)
+    record_questions(student_id, lecture_id, kept, db_path)
+    return kept, rejected
@@ -0,0 +1,105 @@
+import os
+import queue
+import threading
+
+import database
+from salience import quiz_topic_score, topic_links
+from quiz_generator import generate_quiz
+
+
+# Quizzes kept ready per lecture and chunk set, and the level that triggers a refill
+QUIZ_BANK_TARGET = int(os.getenv("QUIZ_BANK_TARGET") or 3)
+QUIZ_BANK_LOW_WATERMARK = int(os.getenv("QUIZ_BANK_LOW_WATERMARK") or 1)
+
+
+def chunk_key(positions) -> str:
+    """Bank key of a chunk set; the order chunks were picked in does not matter"""
+    return ",".join(str(int(p)) for p in sorted(positions))
+
+
+class QuizBank:
+    """
+    Quizzes generated ahead of time and stored in progress.db.
+
+    take() serves a banked quiz instantly and, when the stock for that
+    lecture and chunk set falls below the low watermark, asks the
+    background workers to generate more. Stock lives in SQLite, so it is
+    shared by every session and survives restarts.
+
+    Callers key the bank on a lecture's default chunk set (the one filled at
+    upload), not on a per-student selection, which would rarely be asked for
+    twice; a student's weak topics pick among the stocked quizzes instead.
+    """
+    def __init__(self, db_path=None, target: int = QUIZ_BANK_TARGET,
+                 low_watermark: int = QUIZ_BANK_LOW_WATERMARK, workers: int = 2):
+        self.db_path = db_path
+        self.target = target
+        self.low_watermark = low_watermark
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._scheduled = set()
+        database.init_db(db_path)
+        for i in range(workers):
+            threading.Thread(target=self._run, name=f"quiz-bank-{i}", daemon=True).start()
+
+    def request_fill(self, lecture_id: str, positions, api_key: str = None):
+        """Top up the bank for a chunk set in the background (no-op if already scheduled)"""
+        key = (lecture_id, chunk_key(positions))
+        with self._lock:
+            if key in self._scheduled:
+                return
+            self._scheduled.add(key)
+        self._queue.put((lecture_id, sorted(int(p) for p in positions), api_key))
+
+    def take(self, lecture_id: str, positions, api_key: str = None, topics: dict = None):
+        """
+        A banked quiz for the chunk set, or None if the bank is empty (or, given
+        weak topics {name: weight}, holds nothing on them). Triggers a refill
+        either way when low.
+        """
+        key = chunk_key(positions)
+        score = (lambda quiz: quiz_topic_score(quiz, topics)) if topics else None
+        quiz = database.take_banked_quiz(lecture_id, key, self.db_path, score)
+        if database.count_banked_quizzes(lecture_id, key, self.db_path) < self.low_watermark:
+            self.request_fill(lecture_id, positions, api_key)
+        return quiz
+
+    def _fill(self, lecture_id: str, positions: list, api_key: str):
+        key = chunk_key(positions)
+        chunks = database.get_lecture_chunks(lecture_id, self.db_path)
+        selected = {p: chunks[p] for p in positions if p < len(chunks)}
+        if not selected:
+            return
+        while database.count_banked_quizzes(lecture_id, key, self.db_path) < self.target:
+            # Every banked quiz must be a new one, so the cache is bypassed here
+            quiz = generate_quiz("\n".join(selected.values()), api_key=api_key, force_fresh=True,
+                                 call_site="quiz_bank")
+            if not quiz or not quiz.get('questions'):
+                return
+            database.add_banked_quiz(lecture_id, key, quiz, self.db_path)
+            database.link_topic_chunks(
+                lecture_id, topic_links(selected, [q.get('topic') for q in quiz['questions']]), self.db_path
+            )
+
+    def _run(self):
+        while True:
+            lecture_id, positions, api_key = self._queue.get()
+            try:
+                self._fill(lecture_id, positions, api_key)
+            except Exception as e:
+                print(f"Error filling quiz bank: {str(e)}")
+            finally:
+                with self._lock:
+                    self._scheduled.discard((lecture_id, chunk_key(positions)))
+
+
+_bank = None
+_bank_lock = threading.Lock()
+
+def get_quiz_bank() -> QuizBank:
+    """Process-wide quiz bank, started on first use"""
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = QuizBank()
+        return _bank
@@ -1,69 +1,39 @@
 import os
+import re
 import json
-from openai import OpenAI
+import asyncio
+import sqlite3
+import hashlib
 from dotenv import load_dotenv
 from pathlib import Path
 
-
 load_dotenv(dotenv_path=Path(__file__).parent.parent / "config" / ".env")
 
-def generate_quiz(chunk: str, api_key: str = None) -> dict:
-    """
-    Generates technical questions relevant to ANY academic subject while 
-    filtering out administrative/organizational questions with robust LaTeX handling
-    Returns format: {questions: [{question, options, answer, explanation, topic}]}
-    """
+import database
+import llm_telemetry
+from llm_client import get_openai_client, get_async_openai_client, run_async
+from quiz_repair import parse_json, repair_question, repair_quiz
 
-    client = OpenAI(api_key=api_key or os.getenv("OPENAI_API_KEY"))
-    model="gpt-4-turbo"
+QUIZ_MODEL = "gpt-4-turbo"
+# Part of the cache key: bump whenever the prompts below change so older quizzes are not served
+PROMPT_VERSION = "2"
+QUIZ_CACHE_MAX_BYTES = int(float(os.getenv("QUIZ_CACHE_MAX_MB") or 64) * 1024 * 1024)
 
-    # Groq model
-    # client = OpenAI(
-    # api_key=api_key or os.getenv("GROQ_API_KEY"),
-    # base_url="https://api.groq.com/openai/v1"  
-    # )
-    # model="deepseek-r1-distill-llama-70b"
-    # model="llama3-70b-8192"
-    # model="deepseek-r1-distill-llama-70b"
-    # model="llama3-70b-8192"
+def quiz_cache_key(text: str, model: str, count: int = 5) -> str:
+    """Hash of everything that determines a generated quiz"""
+    return hashlib.sha256(f"{PROMPT_VERSION}\0{model}\0{count}\0{text}".encode("utf-8")).hexdigest()
 
-    # original system prompt
-    system_prompt = f"""You are an expert quiz generator specializing in academic content.
+def _quiz_messages(chunk: str, count: int = 5) -> list:
+    """System and user messages asking for count questions on the first 3000 characters of chunk"""
+    # LaTeX is checked and repaired locally (quiz_repair), so the prompt only states the convention
+    system_prompt = """You are an expert quiz generator specializing in academic content.
     Rules:
-    1. Focus ONLY on technical/scientific concepts from the provided text. 
+    1. Focus ONLY on technical/scientific concepts from the provided text.
     2. NEVER create questions about schedules, logistics, or course administration, grade bonus, management, etc.
     3. Adapt to the subject matter (biology, CS, physics, etc.), focus on content which is important for the student to learn. Focus on the theoretical concepts.
-    4. For mathematical expressions, ALWAYS wrap them in LaTeX math delimiters and use double braces:
-       - Use `$...$` for inline math: $\\\\frac{{1}}{{2}}$
-       - Use `$...$` for displayed equations
-       - Use `$...$` for mathematical variables such as f,x and any other mathematical expressions 
-    5. Include fundamental concepts and key terminology
-    6. For LaTeX formatting:
-       - Powers: Use ^ (e.g., $x^{{2}}$)
-       - Subscripts: Use _ (e.g., $x_{{1}}$)
-       - Fractions: $\\\\frac{{numerator}}{{denominator}}$
-       - Derivatives: $\\\\frac{{d}}{{dx}}(x^{{n}}) = nx^{{n-1}}$
-       - Integrals: $\\\\int_{{a}}^{{b}} f(x)dx = F(b) - F(a)$
-       - Limits: $\\\\lim_{{h \\to 0}} \\\\frac{{f(x + h) - f(x)}}{{h}}$
-       - Greek letters: $\\\\alpha$, $\\\\beta$
-       - Special functions: $\\\\sin$, $\\\\cos$, $\\\\log$
-    7. Common commands needing double backslash:
-        - $\\\\text{{x}}$
-        - $\\\\to$
-        - $\\\\triangle$
-        - $\\\\sum$
-        - $\\\\int$
-    8. Every $ must have a corresponding $ 
-    9. When using $\\\text{...}$, make sure to use $...$
-    
-    VALIDATION STEPS:
-        1. Did you use double backslash (\\\\) for EVERY LaTeX command?
-        2. Did you use four braces {{{{}}}} for EVERY argument?
-        3. Did you properly wrap all math in $ or $$?
-        4. Did you check \\\\frac, \\\\sin, \\\\cos, \\\\log, \\\\int, \\\\lim, \\\\sum, \\\\begin, \\\\end, \\\\alpha, \\\\beta, \\\\gamma, \\\\sin(x), \\\\cos(x), \\\\log(x)?
-        5. Did you check mathematical expressions, formulas, and equations are wrapped in $  and begin and end with $ ?
-        6. Did you check that every $ has a corresponding $?
-    Return your response in JSON format. Include the word 'json' in your response.
+    4. Include fundamental concepts and key terminology.
+    5. Write all mathematics in LaTeX inside $...$, e.g. $\\frac{1}{2}$.
+    Return your response in JSON format.
     """
 
     # system_prompt = f'''You are an expert quiz generator specializing in academic content. You must follow these strict rules for LaTeX formatting in JSON:
@@ -125,51 +95,14 @@ def generate_quiz(chunk: str, api_key: str = None) -> dict:
     # Return your response in JSON format. Include the word 'json' in your response.
     # '''
 
-    # original prompt
     user_prompt = f"""
-    Generate 5 quiz questions from this text:
+    Generate {count} quiz questions from this text:
     
     === TEXT TO PROCESS ===
     {chunk[:3000]}
     
-    Format each question as:
-    {{
-        "questions": [
-            {{
-                "question": "Question text with LaTeX notation",
-                "options": [
-                    "$\\\\frac{{d}}{{dx}}(x^{{n}}) = nx^{{n-1}}$",
-                    "Other options..."
-                ],
-                "answer": "Correct answer",
-                "explanation": "Explanation",
-                "topic": "Specific subfield"
-            }}
-        ]
-    }}
-
-    IMPORTANT: 
-    1. Always wrap mathematical expressions, formulas, and equations in $ or $$ delimiters!
-    2. Always use double backslash (\\\\) for LaTeX commands!
-    3. Always use double braces {{}} for LaTeX arguments!
-
-    
-    Examples of proper LaTeX formatting:
-    - Fractions: $\\\\frac{{1}}{{2}}$
-    - Derivatives: $\\\\frac{{d}}{{dx}}(x^{{n}}) = nx^{{n-1}}$
-    - Integrals: $\\\\int_{{a}}^{{b}} f(x)dx = F(b) - F(a)$
-    - Limits: $\\\\\lim_{{h \\to 0}} \\\\frac{{f(x + h) - f(x)}}{{h}}$
-    - Summations: $\\\\sum_{{i=1}}^{{n}} i^{{2}}$
-    - Matrices: $\\\\begin{{bmatrix}} a & b \\\\\\\\ c & d \\\\\\\\end{{bmatrix}}$
-    - Greek letters: $\\\\alpha$, $\\\\beta$, $\\\\gamma$
-    - Functions: $\\\\sin(x)$, $\\\\cos(x)$, $\\\\log(x)$
-
-    Validation steps:
-    1. Did you use double backslash (\\\\) for EVERY LaTeX command?
-    2. Did you use four braces {{{{}}}} for EVERY argument?
-    3. Did you properly wrap all math in $ or $$?
-    4. Did you check \\\\frac, \\\\sin, \\\\cos, \\\\log, \\\\int, \\\\lim, \\\\sum, \\\\begin, \\\\end, \\\\alpha, \\\\beta, \\\\gamma, \\\\sin(x), \\\\cos(x), \\\\log(x)?
-    5. Did you check mathematical expressions, formulas, and equations are wrapped in $ or $$, and begin and end with $ or $$?
+    Format:
+    {{"questions": [{{"question": "...", "options": ["...", "..."], "answer": "the correct option, verbatim", "explanation": "...", "topic": "Specific subfield"}}]}}
     """
 
 
@@ -211,24 +144,264 @@ def generate_quiz(chunk: str, api_key: str = None) -> dict:
     # - Functions: $\sin(x)$, $\cos(x)$, $\log(x)$
     # """
 
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_prompt}
+    ]
+
+def generate_quiz(chunk: str, api_key: str = None, force_fresh: bool = False,
+                  call_site: str = "quiz") -> dict:
+    """
+    Generates technical questions relevant to ANY academic subject while 
+    filtering out administrative/organizational questions with robust LaTeX handling
+    Returns format: {questions: [{question, options, answer, explanation, topic}]}
+
+    Quizzes are cached on disk by text, model and prompt version, so an identical
+    request is answered without an LLM call. force_fresh always calls the model
+    (and replaces the cached quiz). call_site tags the call in llm_telemetry.
+    """
+
+    model = QUIZ_MODEL
+    cache_key = quiz_cache_key(chunk[:3000], model)
+    if not force_fresh:
+        cached = _read_cache(cache_key)
+        if cached:
+            llm_telemetry.record_cache_hit(call_site, model)
+            return cached
+
+    client = get_openai_client(api_key)
+
+    # Groq model
+    # client = get_openai_client(
+    # api_key=api_key or os.getenv("GROQ_API_KEY"),
+    # base_url="https://api.groq.com/openai/v1"  
+    # )
+    # model="deepseek-r1-distill-llama-70b"
+    # model="llama3-70b-8192"
+    # model="deepseek-r1-distill-llama-70b"
+    # model="llama3-70b-8192"
 
     try:
-        response = client.chat.completions.create(
-            model=model,
-            # model=model,
-            # model="gpt-4-turbo",
-            # model="deepseek-r1-distill-llama-70b",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt}
-            ],
-            response_format={"type": "json_object"},
-       
-            temperature=0.4
-        )
-
-        quiz_data = json.loads(response.choices[0].message.content)
+        with llm_telemetry.track(call_site, model, cache="bypass" if force_fresh else "miss") as call:
+            response = client.chat.completions.create(
+                model=model,
+                # model=model,
+                # model="gpt-4-turbo",
+                # model="deepseek-r1-distill-llama-70b",
+                messages=_quiz_messages(chunk),
+                response_format={"type": "json_object"},
+           
+                temperature=0.4
+            )
+            call.set_usage(response.usage)
+
+        quiz_data = repair_quiz(parse_json(response.choices[0].message.content))
+        _write_cache(cache_key, quiz_data)
         return quiz_data
     except Exception as e:
         print(f"Error generating quiz: {str(e)}")
-        raise
\ No newline at end of file
+        raise
+
+class QuestionStreamParser:
+    """
+    Incremental parser for a streamed {"questions": [...]} response.
+    feed() takes the next piece of text and returns the questions completed by it.
+    """
+    _ARRAY_START = re.compile(r'"questions"\s*:\s*\[')
+
+    def __init__(self):
+        self.text = ""
+        self._pos = None  # scan position inside the questions array, once found
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._start = None
+        self._done = False
+
+    def feed(self, piece: str) -> list:
+        self.text += piece
+        if self._done:
+            return []
+        if self._pos is None:
+            match = self._ARRAY_START.search(self.text)
+            if not match:
+                return []
+            self._pos = match.end()
+
+        completed = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            ch = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif ch == "\\":
+                    self._escaped = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"':
+                self._in_string = True
+            elif ch == "{":
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == "}":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        question = repair_question(parse_json(text[self._start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        print(f"Skipping malformed streamed question: {str(e)}")
+                    else:
+                        if question is not None:
+                            completed.append(question)
+            elif ch == "]" and self._depth == 0:
+                self._done = True
+                break
+        self._pos = len(text)
+        return completed
+
+def stream_quiz(chunk: str, api_key: str = None, force_fresh: bool = False):
+    """
+    Like generate_quiz, but yields each question as soon as the model has
+    finished writing it, so the first one can be shown while the rest are
+    still being generated. A cached quiz is yielded straight away.
+    """
+    model = QUIZ_MODEL
+    cache_key = quiz_cache_key(chunk[:3000], model)
+    if not force_fresh:
+        cached = _read_cache(cache_key)
+        if cached:
+            llm_telemetry.record_cache_hit("quiz_stream", model)
+            yield from cached.get("questions", [])
+            return
+
+    client = get_openai_client(api_key)
+    parser = QuestionStreamParser()
+    questions = []
+    try:
+        with llm_telemetry.track("quiz_stream", model, cache="bypass" if force_fresh else "miss") as call:
+            stream = client.chat.completions.create(
+                model=model,
+                messages=_quiz_messages(chunk),
+                response_format={"type": "json_object"},
+                temperature=0.4,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            for event in stream:
+                # The last event carries the token counts and no choices
+                call.set_usage(event.usage)
+                if not event.choices:
+                    continue
+                content = event.choices[0].delta.content or ""
+                if content:
+                    call.first_token()
+                for question in parser.feed(content):
+                    questions.append(question)
+                    yield question
+    except Exception as e:
+        print(f"Error generating quiz: {str(e)}")
+        raise
+
+    try:
+        quiz_data = repair_quiz(parse_json(parser.text))
+    except json.JSONDecodeError:
+        quiz_data = {"questions": questions}
+    _write_cache(cache_key, quiz_data)
+
+def _read_cache(cache_key: str):
+    """Cached quiz, or None. A quiz without questions counts as a miss"""
+    try:
+        cached = database.get_cached_quiz(cache_key)
+    except sqlite3.Error as e:
+        print(f"Quiz cache unavailable: {str(e)}")
+        return None
+    return cached if cached and cached.get("questions") else None
+
+def _write_cache(cache_key: str, quiz_data: dict):
+    # Every question may have been dropped by repair_quiz; retry those next time
+    if not quiz_data.get("questions"):
+        return
+    try:
+        database.cache_quiz(cache_key, quiz_data, QUIZ_CACHE_MAX_BYTES)
+    except sqlite3.Error as e:
+        print(f"Quiz cache unavailable: {str(e)}")
+
+# Concurrent requests per fan-out
+FANOUT_CONCURRENCY = int(os.getenv("QUIZ_FANOUT_CONCURRENCY") or 5)
+
+def _question_terms(question: dict) -> set:
+    return set(re.findall(r"\w+", str(question.get("question", "")).lower()))
+
+def dedupe_questions(questions: list, threshold: float = 0.6) -> list:
+    """Drop questions whose wording overlaps an earlier one by at least threshold (Jaccard on words)"""
+    kept, kept_terms = [], []
+    for question in questions:
+        terms = _question_terms(question)
+        if any(terms and len(terms & other) / len(terms | other) >= threshold for other in kept_terms):
+            continue
+        kept.append(question)
+        kept_terms.append(terms)
+    return kept
+
+async def _generate_for_chunk(client, semaphore, chunk: str, count: int, force_fresh: bool) -> list:
+    async with semaphore:
+        with llm_telemetry.track("quiz_parallel", QUIZ_MODEL, cache="bypass" if force_fresh else "miss") as call:
+            response = await client.chat.completions.create(
+                model=QUIZ_MODEL,
+                messages=_quiz_messages(chunk, count),
+                response_format={"type": "json_object"},
+                temperature=0.4
+            )
+            call.set_usage(response.usage)
+    quiz_data = repair_quiz(parse_json(response.choices[0].message.content))
+    # SQLite calls block, so keep them off the shared event loop
+    await asyncio.to_thread(_write_cache, quiz_cache_key(chunk[:3000], QUIZ_MODEL, count), quiz_data)
+    return quiz_data.get("questions", [])
+
+async def _fan_out(chunks: list, api_key: str, count: int, force_fresh: bool) -> list:
+    client = get_async_openai_client(api_key)
+    semaphore = asyncio.Semaphore(FANOUT_CONCURRENCY)
+    return await asyncio.gather(
+        *(_generate_for_chunk(client, semaphore, chunk, count, force_fresh) for chunk in chunks),
+        return_exceptions=True
+    )
+
+def generate_quiz_parallel(chunks: list, api_key: str = None, questions_per_chunk: int = 2,
+                           max_questions: int = 5, force_fresh: bool = False) -> dict:
+    """
+    One small request per chunk, run concurrently, instead of one request on
+    the joined (and truncated) text. Questions are merged round-robin across
+    chunks for coverage, near-duplicates are dropped, and at most
+    max_questions are kept. Each chunk's result is cached separately, and
+    only the chunks missing from the cache are sent to the model.
+    """
+    if not chunks:
+        return {"questions": []}
+    results = [None] * len(chunks)
+    if not force_fresh:
+        for i, chunk in enumerate(chunks):
+            cached = _read_cache(quiz_cache_key(chunk[:3000], QUIZ_MODEL, questions_per_chunk))
+            if cached:
+                llm_telemetry.record_cache_hit("quiz_parallel", QUIZ_MODEL)
+                results[i] = cached.get("questions", [])
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        generated = run_async(_fan_out([chunks[i] for i in missing], api_key, questions_per_chunk, force_fresh))
+        for i, result in zip(missing, generated):
+            results[i] = result
+    errors = [r for r in results if isinstance(r, Exception)]
+    for error in errors:
+        print(f"Error generating quiz for a chunk: {str(error)}")
+    per_chunk = [r for r in results if not isinstance(r, Exception)]
+    if not per_chunk:
+        raise errors[0]
+
+    merged = [
+        questions[i]
+        for i in range(max((len(questions) for questions in per_chunk), default=0))
+        for questions in per_chunk
+        if i < len(questions)
+    ]
+    return {"questions": dedupe_questions(merged)[:max_questions]}
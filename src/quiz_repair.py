@@ -0,0 +1,166 @@
+import re
+import json
+
+
+# LaTeX commands whose backslash JSON swallows: "\frac" decodes to a form feed
+# followed by "rac", "\times" to a tab and "imes", "\nabla" to a newline, ...
+_CONTROL_COMMANDS = {
+    "\f": ("frac", "forall", "flat"),
+    "\b": ("beta", "bar", "binom", "begin", "bigcup", "bigcap", "bmod", "boldsymbol", "bullet"),
+    "\r": ("rho", "right", "rightarrow", "rangle", "rfloor", "rceil"),
+    "\t": ("text", "textbf", "textit", "times", "theta", "tau", "tan", "tanh", "to", "triangle", "tilde"),
+    "\n": ("nabla", "ne", "neq", "not", "notin", "neg", "nu", "newline"),
+}
+# Form feeds, backspaces and carriage returns never belong in a question; tabs
+# and newlines do, so those are only read as lost backslashes inside math
+_ALWAYS = "\f\b\r"
+
+
+def _command_pattern(chars: str) -> re.Pattern:
+    return re.compile("|".join(
+        f"{re.escape(char)}({'|'.join(sorted((c[1:] for c in _CONTROL_COMMANDS[char]), key=len, reverse=True))})"
+        "(?![A-Za-z])"
+        for char in chars
+    ))
+
+
+_PROSE_COMMANDS = _command_pattern(_ALWAYS)
+_MATH_COMMANDS = _command_pattern(_ALWAYS + "\t\n")
+_CONTROL_LETTERS = {"\f": "f", "\b": "b", "\r": "r", "\t": "t", "\n": "n"}
+# The same commands after the control character has been stripped (the old app.py patch)
+_BARE_COMMANDS = re.compile(r"(?<![\\A-Za-z])(rac|ext|imes)(?=\{)")
+_BARE_FIXES = {"rac": "\\frac", "ext": "\\text", "imes": "\\times"}
+# Backslashes in raw JSON that do not start a valid escape, e.g. "\alpha" or "\sum"
+_INVALID_ESCAPE = re.compile(r'(?<!\\)((?:\\\\)*)\\(?![\\"/bfnrtu])')
+# Valid JSON escapes that are really the start of a LaTeX command
+_ESCAPED_COMMAND = re.compile(
+    r'(?<!\\)((?:\\\\)*)\\(' + "|".join(
+        sorted((c for commands in _CONTROL_COMMANDS.values() for c in commands), key=len, reverse=True)
+    ) + r')(?![A-Za-z])'
+)
+
+
+def parse_json(text: str) -> dict:
+    """
+    json.loads that tolerates the usual model mistakes: a ```json fence or
+    prose around the object, and single backslashes in LaTeX commands.
+    """
+    text = text.strip()
+    start, end = text.find("{"), text.rfind("}")
+    if start != -1 and end > start:
+        text = text[start:end + 1]
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    escaped = _ESCAPED_COMMAND.sub(r"\1\\\\\2", text)
+    escaped = _INVALID_ESCAPE.sub(r"\1\\\\", escaped)
+    return json.loads(escaped)
+
+
+def _restore_commands(text: str, pattern: re.Pattern) -> str:
+    text = pattern.sub(lambda m: "\\" + _CONTROL_LETTERS[m.group(0)[0]] + m.group(0)[1:], text)
+    return _BARE_COMMANDS.sub(lambda m: _BARE_FIXES[m.group(1)], text)
+
+
+def _balance_braces(math: str) -> str:
+    """Drop unmatched closing braces and close any left open"""
+    out, depth, i = [], 0, 0
+    while i < len(math):
+        ch = math[i]
+        if ch == "\\" and i + 1 < len(math):
+            out.append(math[i:i + 2])
+            i += 2
+            continue
+        if ch == "{":
+            depth += 1
+        elif ch == "}":
+            if depth == 0:
+                i += 1
+                continue
+            depth -= 1
+        out.append(ch)
+        i += 1
+    return "".join(out) + "}" * depth
+
+
+# What makes the text after an unmatched $ look like math rather than prose
+_TEX_MARKERS = re.compile(r"[\\^_{]")
+
+
+def repair_latex(text: str) -> str:
+    """
+    Fix the LaTeX in one quiz string: restore commands whose backslash was
+    lost and balance the braces inside each math span. An unmatched $ or $$
+    is closed at the end of the string if what follows it looks like TeX,
+    and escaped otherwise (a currency sign: "costs $5").
+    """
+    if not isinstance(text, str):
+        return text
+    parts = re.split(r"(?<!\\)(\$\$|\$)", text)
+    out, delimiter, opened, tail = [], None, 0, []
+    for part in parts:
+        if part in ("$", "$$"):
+            if delimiter is None:
+                delimiter, opened, tail = part, len(out), []
+            elif part == delimiter:
+                delimiter = None
+            else:
+                # "$" inside "$$...$$" (or the reverse): treat it as the closing delimiter
+                part = delimiter
+                delimiter = None
+            out.append(part)
+        elif delimiter is not None:
+            tail.append(part)
+            out.append(_balance_braces(_restore_commands(part, _MATH_COMMANDS)))
+        else:
+            out.append(_restore_commands(part, _PROSE_COMMANDS))
+    if delimiter is not None:
+        if _TEX_MARKERS.search("".join(out[opened + 1:])):
+            out.append(delimiter)
+        else:
+            out = out[:opened] + ["\\$" * len(delimiter), _restore_commands("".join(tail), _PROSE_COMMANDS)]
+    return "".join(out)
+
+
+def _normalise(text: str) -> str:
+    return " ".join(str(text).split())
+
+
+def repair_question(question: dict):
+    """
+    Repaired copy of one question, or None if it cannot be shown and marked:
+    no question text, fewer than two options, or an answer that matches no
+    option (a bare "A".."D" is read as an option letter).
+    """
+    if not isinstance(question, dict) or not question.get("question"):
+        return None
+    options = question.get("options")
+    if not isinstance(options, list):
+        return None
+    options = [repair_latex(str(option)) for option in options if str(option).strip()]
+    if len(options) < 2:
+        return None
+    answer = repair_latex(str(question.get("answer", "")))
+    if answer not in options:
+        matches = [option for option in options if _normalise(option) == _normalise(answer)]
+        letter = answer.strip().rstrip(").").upper()
+        if matches:
+            answer = matches[0]
+        elif len(letter) == 1 and "A" <= letter < chr(ord("A") + len(options)):
+            answer = options[ord(letter) - ord("A")]
+        else:
+            return None
+    repaired = {key: repair_latex(value) for key, value in question.items()}
+    repaired["options"] = options
+    repaired["answer"] = answer
+    return repaired
+
+
+def repair_quiz(quiz_data: dict) -> dict:
+    """{questions: [...]} with every question repaired and unusable ones dropped"""
+    questions = quiz_data.get("questions", []) if isinstance(quiz_data, dict) else []
+    repaired = [q for q in (repair_question(q) for q in questions) if q is not None]
+    if len(repaired) < len(questions):
+        print(f"Dropped {len(questions) - len(repaired)} malformed quiz question(s)")
+    return {**quiz_data, "questions": repaired} if isinstance(quiz_data, dict) else {"questions": repaired}
@@ -1,21 +1,34 @@
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, UnstructuredMarkdownLoader, UnstructuredWordDocumentLoader
 from langchain.text_splitter import CharacterTextSplitter
-from langchain_community.embeddings import OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
 from langchain.chains import RetrievalQA
 from langchain_community.llms import OpenAI
 import os
+import uuid
 import shutil
 from typing import BinaryIO, Union, List, Dict
 from pathlib import Path
 
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores.faiss import dependable_faiss_import
+from langchain_core.documents import Document
+
+from embeddings import DEFAULT_BACKEND, get_embeddings, backend_signature, write_backend_manifest, read_backend_manifest
 
 
 class RAG:
-    def __init__(self, openai_api_key: str):
-        """Initialize RAG with OpenAI API key"""
+    def __init__(self, openai_api_key: str, embedding_backend: str = None):
+        """
+        Initialize RAG with OpenAI API key
+
+        Args:
+            openai_api_key: Used for the QA LLM and the "openai" embedding backend
+            embedding_backend: "openai", "sentence-transformers" or "hashing"
+                (defaults to the EMBEDDING_BACKEND environment variable, then "openai")
+        """
         self.openai_api_key = openai_api_key
+        self.embedding_backend = embedding_backend
         self.vectorstore = None
         self.qa = None
 
@@ -70,14 +83,11 @@ class RAG:
         chunks = text_splitter.split_documents(documents)
         
         # Create vector index
-        embeddings = OpenAIEmbeddings(openai_api_key=self.openai_api_key)
+        embeddings = get_embeddings(self.embedding_backend, self.openai_api_key)
         self.vectorstore = FAISS.from_documents(chunks, embeddings)
 
         # Initialize QA chain
-        self.qa = RetrievalQA.from_chain_type(
-            llm=OpenAI(api_key=self.openai_api_key), 
-            retriever=self.vectorstore.as_retriever()
-        )
+        self._init_qa()
         
         # Clean up temporary file if we created one
         if not isinstance(file, (str, Path)):
@@ -85,6 +95,35 @@ class RAG:
             
         return chunks
 
+    def rebuild(self, texts: List[str], index_path: Union[str, Path] = None) -> None:
+        """
+        Build the vector store from chunk texts without unpickling anything.
+        With index_path, the vectors are read from the index.faiss saved there,
+        which must hold one vector per text in the same order; only the
+        docstore is rebuilt. Otherwise the texts are embedded again.
+        """
+        embeddings = get_embeddings(self._backend_name(), self.openai_api_key)
+        if index_path is not None:
+            index = dependable_faiss_import().read_index(str(Path(index_path) / "index.faiss"))
+            if index.ntotal != len(texts):
+                raise ValueError(f"FAISS index holds {index.ntotal} vectors for {len(texts)} chunks")
+            ids = [str(uuid.uuid4()) for _ in texts]
+            docstore = InMemoryDocstore({doc_id: Document(page_content=text) for doc_id, text in zip(ids, texts)})
+            self.vectorstore = FAISS(embeddings, index, docstore, dict(enumerate(ids)))
+        else:
+            self.vectorstore = FAISS.from_texts(texts, embeddings)
+        self._init_qa()
+
+    def _init_qa(self) -> None:
+        """Build the QA chain. Local embedding backends can run without an API key, so skip it then."""
+        if not self.openai_api_key:
+            self.qa = None
+            return
+        self.qa = RetrievalQA.from_chain_type(
+            llm=OpenAI(api_key=self.openai_api_key),
+            retriever=self.vectorstore.as_retriever()
+        )
+
     def ask_question(self, question: str) -> Dict:
         """
         Ask a question and get relevant content from the vector database
@@ -95,7 +134,7 @@ class RAG:
         Returns:
             Dict containing the question and relevant texts
         """
-        if not self.qa or not self.vectorstore:
+        if not self.vectorstore:
             raise ValueError("No PDF has been ingested yet. Please call ingest() first.")
 
         # Retrieve relevant content using vector database
@@ -116,24 +155,33 @@ class RAG:
         
         # Save the vector store
         self.vectorstore.save_local(str(path))
+        write_backend_manifest(path, self._backend_name())
+
+    def _backend_name(self) -> str:
+        return self.embedding_backend or DEFAULT_BACKEND
 
     def load(self, path: Union[str, Path]) -> None:
         """Load the vector store from disk."""
         path = Path(path)
         if not path.exists():
             raise FileNotFoundError(f"Vector store not found at {path}")
-            
+
+        # Query vectors must come from the same model that built the index
+        stored_backend = read_backend_manifest(path)
+        if stored_backend != backend_signature(self._backend_name()):
+            raise ValueError(
+                f"Vector store at {path} was built with the '{stored_backend}' embedding backend, "
+                f"but '{backend_signature(self._backend_name())}' is configured"
+            )
+
         try:
             self.vectorstore = FAISS.load_local(
                 str(path),
-                OpenAIEmbeddings(api_key=self.openai_api_key),
+                get_embeddings(self._backend_name(), self.openai_api_key),
                 allow_dangerous_deserialization=True
             )
             
             # Reinitialize QA chain with loaded vectorstore
-            self.qa = RetrievalQA.from_chain_type(
-                llm=OpenAI(api_key=self.openai_api_key),
-                retriever=self.vectorstore.as_retriever()
-            )
+            self._init_qa()
         except Exception as e:
             raise Exception(f"Error loading vector store: {str(e)}")
@@ -0,0 +1,210 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import sqlite3
+import threading
+from pathlib import Path
+from collections import Counter
+from datetime import datetime, timezone
+
+import psutil
+from filelock import FileLock
+
+import database
+
+
+JOURNAL_DIR = Path(__file__).parent.parent / "data" / "quiz_journal"
+# Longest wait between retries while the database cannot be written
+MAX_RETRY_DELAY = 5.0
+
+
+class QuizResultWriter:
+    """
+    Write-behind queue for quiz submissions.
+
+    submit() appends the submission to a small per-process journal and
+    queues it; a background thread writes queued submissions in batches,
+    one transaction per batch. A batch that cannot be written (e.g. the
+    database is locked) is retried with backoff; a submission that can
+    never be written is moved to rejected.ndjson so it cannot hold up the
+    rest. The journal is cleared only once everything in it is committed,
+    and journals left by crashed processes are replayed on start. Replays
+    are idempotent thanks to submission ids.
+    """
+    def __init__(self, db_path=None, journal_dir=None, flush_interval: float = 0.25, batch_size: int = 200):
+        self.db_path = db_path
+        self.journal_dir = Path(journal_dir) if journal_dir else JOURNAL_DIR
+        self.journal_dir.mkdir(parents=True, exist_ok=True)
+        self.journal_path = self.journal_dir / f"{os.getpid()}.jsonl"
+        self.rejected_path = self.journal_dir / "rejected.ndjson"
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._pending_by_student = Counter()
+        self._idle = threading.Condition(self._lock)
+        self._stopped = threading.Event()
+
+        database.init_db(db_path)
+        self.recover()
+        self._thread = threading.Thread(target=self._run, name="quiz-result-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, student_id: int, questions: list) -> str:
+        """Queue a quiz submission. Returns its submission id."""
+        submission = {
+            "submission_id": str(uuid.uuid4()),
+            "student_id": student_id,
+            "timestamp": datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
+            "questions": [
+                {key: q.get(key) for key in ("question", "student_answer", "answer", "topic") if key in q}
+                for q in questions
+            ]
+        }
+        line = json.dumps(submission, ensure_ascii=False) + "\n"
+        with self._lock:
+            # Flushed to the OS, not fsynced: survives a process crash without waiting on the disk
+            with open(self.journal_path, "a", encoding="utf-8") as f:
+                f.write(line)
+            self._pending += 1
+            self._pending_by_student[student_id] += 1
+        self._queue.put(submission)
+        return submission["submission_id"]
+
+    def _run(self):
+        delay = self.flush_interval
+        while not self._stopped.is_set() or not self._queue.empty():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                continue
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            handled, _, retry = self._write(batch)
+            retried = {id(submission) for submission in retry}
+            with self._lock:
+                self._pending -= handled
+                for submission in batch:
+                    if id(submission) not in retried:
+                        self._pending_by_student[submission["student_id"]] -= 1
+                        if self._pending_by_student[submission["student_id"]] <= 0:
+                            del self._pending_by_student[submission["student_id"]]
+                if self._pending == 0:
+                    self._truncate_journal()
+                self._idle.notify_all()
+            if not retry:
+                delay = self.flush_interval
+            elif not self._stopped.is_set():
+                # Still pending and still in the journal; try again after a growing pause
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+                for submission in retry:
+                    self._queue.put(submission)
+            # When stopping, unwritten submissions stay in the journal and are replayed on the next start
+
+    def _write(self, submissions: list) -> tuple:
+        """
+        Commit submissions, isolating any that can never be written.
+        Returns (submissions done with, quizzes written, submissions to retry).
+        """
+        try:
+            return len(submissions), database.log_quiz_batch(submissions, self.db_path), []
+        except sqlite3.OperationalError as e:
+            # Locked, busy or out of disk: nothing was written, so retry the lot later
+            print(f"Error writing quiz results, will retry: {str(e)}")
+            return 0, 0, submissions
+        except Exception as e:
+            if len(submissions) == 1:
+                print(f"Rejected quiz submission {submissions[0].get('submission_id')}: {str(e)}")
+                self._reject(submissions[0])
+                return 1, 0, []
+        # One bad submission must not fail the whole batch: write them one at a time
+        handled, written, retry = 0, 0, []
+        for submission in submissions:
+            done, count, again = self._write([submission])
+            handled, written, retry = handled + done, written + count, retry + again
+        return handled, written, retry
+
+    def _reject(self, submission: dict):
+        try:
+            with open(self.rejected_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(submission, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            print(f"Could not keep rejected quiz submission: {str(e)}")
+
+    def _truncate_journal(self):
+        try:
+            open(self.journal_path, "w").close()
+        except OSError:
+            pass
+
+    def pending(self, student_id: int = None) -> int:
+        """Submissions queued but not yet written or rejected (only those of student_id, if given)"""
+        with self._lock:
+            return self._pending if student_id is None else self._pending_by_student[student_id]
+
+    def flush(self, timeout: float = None) -> bool:
+        """Block until every submitted result has been written (or rejected). Returns False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def close(self):
+        """Drain the queue and stop the background thread"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+
+    def recover(self) -> int:
+        """
+        Replay journals left behind by crashed processes (and this pid's old one).
+        Journals of live processes are replayed but kept, since their owners
+        still manage them, and so is any journal that could not be fully
+        written. Returns the number of quizzes written.
+        """
+        written = 0
+        with FileLock(str(self.journal_dir / "recover.lock"), timeout=30):
+            for journal in self.journal_dir.glob("*.jsonl"):
+                submissions = []
+                with open(journal, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            submissions.append(json.loads(line))
+                        except json.JSONDecodeError:
+                            # Torn last line from a crash mid-write
+                            continue
+                retry = []
+                if submissions:
+                    _, count, retry = self._write(submissions)
+                    written += count
+                if retry:
+                    continue
+                owner = int(journal.stem) if journal.stem.isdigit() else None
+                if owner == os.getpid():
+                    # Our own journal: left by an earlier process with this pid, or still live
+                    if not self._pending:
+                        self._truncate_journal()
+                elif owner is None or not psutil.pid_exists(owner):
+                    journal.unlink()
+        return written
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_result_writer() -> QuizResultWriter:
+    """Process-wide writer, started on first use"""
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = QuizResultWriter()
+        return _writer
@@ -0,0 +1,226 @@
+import io
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+
+# Chunk ranking used for quiz selection: centrality, coverage or tfidf_sum (the original ranking)
+SALIENCE_MEASURES = ("centrality", "coverage", "tfidf_sum")
+DEFAULT_SALIENCE = os.getenv("SALIENCE_MEASURE") or "centrality"
+# How strongly chunks on weak topics are favoured over the generally most salient ones
+WEAK_TOPIC_BOOST = 2.0
+# Most distinctive terms of each chunk recorded in the topic-to-chunk index
+TOPIC_TERMS_PER_CHUNK = 12
+
+# Tokenizer of every ChunkIndex, so topic names and chunk terms share one vocabulary
+_analyzer = TfidfVectorizer().build_analyzer()
+
+
+class ChunkIndex:
+    """
+    TF-IDF matrix of one lecture's chunks (rows L2-normalised) with
+    precomputed salience scores. Built once at ingest and stored with the lecture.
+    """
+    def __init__(self, vocabulary: list, idf: np.ndarray, matrix: sp.csr_matrix, salience: dict):
+        self.vocabulary = vocabulary
+        self.idf = idf
+        self.matrix = matrix
+        self.salience = salience
+        self._term_ids = None
+
+    @classmethod
+    def build(cls, chunks: list) -> "ChunkIndex":
+        vectorizer = TfidfVectorizer()
+        try:
+            raw = vectorizer.fit_transform(chunks).tocsr()
+        except ValueError:
+            # No usable terms at all (empty or stop-word-only chunks)
+            empty = sp.csr_matrix((len(chunks), 0))
+            zeros = np.zeros(len(chunks))
+            return cls([], np.zeros(0), empty, {measure: zeros for measure in SALIENCE_MEASURES})
+        salience = {
+            "tfidf_sum": np.asarray(raw.sum(axis=1)).ravel(),
+            "centrality": _centrality(raw),
+            "coverage": _coverage(raw),
+        }
+        return cls(vectorizer.get_feature_names_out().tolist(), vectorizer.idf_, raw, salience)
+
+    # ===== Storage =====
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        np.savez_compressed(
+            buffer,
+            vocabulary=np.array(self.vocabulary, dtype=str),
+            idf=self.idf,
+            data=self.matrix.data,
+            indices=self.matrix.indices,
+            indptr=self.matrix.indptr,
+            shape=np.array(self.matrix.shape),
+            **{f"salience_{measure}": scores for measure, scores in self.salience.items()}
+        )
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ChunkIndex":
+        with np.load(io.BytesIO(data)) as f:
+            matrix = sp.csr_matrix((f["data"], f["indices"], f["indptr"]), shape=tuple(f["shape"]))
+            salience = {measure: f[f"salience_{measure}"] for measure in SALIENCE_MEASURES}
+            return cls(f["vocabulary"].tolist(), f["idf"], matrix, salience)
+
+    # ===== Lookups =====
+    def key_chunks(self, k: int = 5, measure: str = None, topic_scores: dict = None) -> list:
+        """
+        Positions of the k most salient chunks, in document order. topic_scores
+        ({position: score}) pulls chunks on the student's weak topics ahead.
+        """
+        measure = measure or DEFAULT_SALIENCE
+        if measure not in self.salience:
+            raise ValueError(f"Unknown salience measure: {measure}")
+        scores = self.salience[measure].astype(float)
+        if len(scores) == 0:
+            return []
+        scores = scores / (scores.max() or 1)
+        if topic_scores:
+            peak = max(topic_scores.values()) or 1
+            for position, score in topic_scores.items():
+                if position < len(scores):
+                    scores[position] += WEAK_TOPIC_BOOST * score / peak
+        return sorted(int(i) for i in scores.argsort()[-k:])
+
+    def search(self, query: str, limit: int = 5) -> list:
+        """[(position, cosine score)] of the chunks most similar to a query, best first"""
+        if self._term_ids is None:
+            self._term_ids = {term: i for i, term in enumerate(self.vocabulary)}
+        counts = {}
+        for term in _analyzer(query):
+            if term in self._term_ids:
+                counts[self._term_ids[term]] = counts.get(self._term_ids[term], 0) + 1
+        if not counts:
+            return []
+        ids = np.fromiter(counts, dtype=int)
+        weights = np.fromiter(counts.values(), dtype=float) * self.idf[ids]
+        scores = self.matrix[:, ids] @ (weights / np.linalg.norm(weights))
+        best = np.argsort(-scores)[:limit]
+        return [(int(i), float(scores[i])) for i in best if scores[i] > 0]
+
+    def topic_rows(self, per_chunk: int = TOPIC_TERMS_PER_CHUNK) -> list:
+        """
+        [(topic, position, weight)] for the topic-to-chunk index: each chunk's
+        per_chunk highest TF-IDF topic terms, weighted relative to its best one
+        """
+        rows = []
+        for position in range(self.matrix.shape[0]):
+            start, end = self.matrix.indptr[position], self.matrix.indptr[position + 1]
+            weights = {}
+            for term_id, weight in zip(self.matrix.indices[start:end], self.matrix.data[start:end]):
+                term = _topic_term(self.vocabulary[term_id])
+                if term:
+                    weights[term] = weights.get(term, 0) + float(weight)
+            top = sorted(weights.items(), key=lambda item: -item[1])[:per_chunk]
+            if top:
+                peak = top[0][1]
+                rows.extend((term, position, weight / peak) for term, weight in top)
+        return rows
+
+
+# ===== Topics =====
+def _topic_term(term: str):
+    """A vocabulary term as a topic term: content words only, a plain plural 's' removed"""
+    if len(term) < 3 or not term[0].isalpha() or term in ENGLISH_STOP_WORDS:
+        return None
+    if len(term) > 4 and term.endswith("s") and not term.endswith("ss"):
+        return term[:-1]
+    return term
+
+
+def topic_terms(text: str) -> list:
+    """Topic terms of a text, e.g. a question's topic name"""
+    return [term for term in map(_topic_term, _analyzer(text or "")) if term]
+
+
+def topic_key(topic: str) -> str:
+    """Name a topic is indexed under: its topic terms, space separated"""
+    return " ".join(topic_terms(topic))
+
+
+def topic_links(chunks: dict, topics: list) -> list:
+    """
+    [(topic, position, weight)] linking question topics to the chunks
+    ({position: text}) they were generated from: each topic to the chunks
+    mentioning one of its terms, or to all of them if none does
+    """
+    chunk_terms = {position: set(topic_terms(text)) for position, text in chunks.items()}
+    rows = []
+    for key in {topic_key(topic) for topic in topics}:
+        if not key:
+            continue
+        terms = set(key.split())
+        positions = [p for p, found in chunk_terms.items() if terms & found] or list(chunk_terms)
+        rows.extend((key, position, 1.0) for position in positions)
+    return rows
+
+
+def topic_lookups(topics: dict) -> dict:
+    """
+    Index entries to look up for weighted topics ({name: weight}): a topic
+    counts fully under its whole name and shares its weight between its terms
+    """
+    lookups = {}
+    for topic, topic_weight in topics.items():
+        key = topic_key(topic)
+        if not key:
+            continue
+        terms = key.split()
+        lookups[key] = lookups.get(key, 0) + topic_weight
+        if len(terms) > 1:
+            for term in terms:
+                lookups[term] = lookups.get(term, 0) + topic_weight / len(terms)
+    return lookups
+
+
+def quiz_topic_score(quiz: dict, topics: dict) -> float:
+    """Summed weight of the topics ({name: weight}) that share a term with a question's topic"""
+    question_terms = [set(topic_terms(q.get("topic"))) for q in quiz.get("questions", [])]
+    return sum(weight for topic, weight in topics.items()
+               if any(terms & set(topic_terms(topic)) for terms in question_terms))
+
+
+def _centrality(matrix: sp.csr_matrix, damping: float = 0.85, iterations: int = 50) -> np.ndarray:
+    """LexRank: PageRank over the chunk-to-chunk cosine similarity graph"""
+    n = matrix.shape[0]
+    if n == 1:
+        return np.ones(1)
+    similarity = (matrix @ matrix.T).toarray()
+    np.fill_diagonal(similarity, 0)
+    row_sums = similarity.sum(axis=1, keepdims=True)
+    transition = np.divide(similarity, row_sums, out=np.full_like(similarity, 1 / n), where=row_sums > 0)
+    rank = np.full(n, 1 / n)
+    for _ in range(iterations):
+        updated = (1 - damping) / n + damping * (transition.T @ rank)
+        if np.abs(updated - rank).sum() < 1e-9:
+            return updated
+        rank = updated
+    return rank
+
+
+def _coverage(matrix: sp.csr_matrix) -> np.ndarray:
+    """
+    Greedy vocabulary coverage: each chunk scores the TF-IDF weight of the
+    terms it adds that no more salient chunk already covers.
+    """
+    n, vocabulary_size = matrix.shape
+    uncovered = np.ones(vocabulary_size)
+    scores = np.zeros(n)
+    remaining = np.ones(n, dtype=bool)
+    for _ in range(n):
+        gains = matrix @ uncovered
+        gains[~remaining] = -1
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break
+        scores[best] = gains[best]
+        remaining[best] = False
+        uncovered[matrix.indices[matrix.indptr[best]:matrix.indptr[best + 1]]] = 0
+    return scores
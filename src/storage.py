@@ -0,0 +1,148 @@
+import os
+import time
+import shutil
+import hashlib
+from pathlib import Path
+from collections import Counter
+from typing import Dict, List, Union
+
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+VECTOR_STORE_ROOT = PROJECT_ROOT / "data" / "vector_stores"
+# Stores are written before their lecture is saved, so garbage collection
+# leaves recently modified directories alone
+STORE_GC_GRACE_SECONDS = float(os.getenv("STORE_GC_GRACE_SECONDS") or 3600)
+
+
+class VectorStoreManager:
+    """
+    Reference-counts vector store directories from lecture records
+    and reclaims the ones no lecture points to anymore.
+    """
+    def __init__(self, lecture_db, root: Union[str, Path] = None):
+        self.lecture_db = lecture_db
+        self.root = Path(root) if root else VECTOR_STORE_ROOT
+
+    def _resolve(self, path: Union[str, Path]) -> Path:
+        # Stores are saved with paths relative to the project root
+        path = Path(path)
+        if not path.is_absolute():
+            path = PROJECT_ROOT / path
+        return path.resolve()
+
+    def _dir_size(self, path: Path) -> int:
+        return sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+    def _fingerprint(self, path: Path) -> str:
+        """
+        Content hash of a store. The FAISS index holds the vectors in insertion
+        order, so two stores with the same index and embedding backend hold the
+        same content even though their pickled docstore ids differ.
+        """
+        digest = hashlib.sha256()
+        index_file = path / "index.faiss"
+        files = [index_file, path / "embedding_backend.json"] if index_file.exists() else sorted(path.iterdir())
+        for f in files:
+            if f.is_file():
+                digest.update(f.name.encode("utf-8"))
+                with open(f, "rb") as fh:
+                    for block in iter(lambda: fh.read(1 << 20), b""):
+                        digest.update(block)
+        return digest.hexdigest()
+
+    def _recently_modified(self, path: Path) -> bool:
+        cutoff = time.time() - STORE_GC_GRACE_SECONDS
+        return any(p.stat().st_mtime > cutoff for p in [path, *path.rglob("*")])
+
+    def references(self) -> Dict[Path, List[str]]:
+        """Ids of the lectures referencing each store directory, however their paths are written"""
+        refs: Dict[Path, List[str]] = {}
+        for lecture in self.lecture_db.list_lectures():
+            if lecture.get("vector_store_path"):
+                refs.setdefault(self._resolve(lecture["vector_store_path"]), []).append(lecture["id"])
+        return refs
+
+    def reference_counts(self) -> Counter:
+        """Number of lectures referencing each store directory."""
+        return Counter({path: len(ids) for path, ids in self.references().items()})
+
+    def release(self, vector_store_path: str) -> int:
+        """
+        Drop a store once its last reference is gone.
+        Call after the lecture record has been deleted.
+        Returns the number of bytes reclaimed.
+        """
+        return self.release_many([vector_store_path])
+
+    def release_many(self, vector_store_paths: List[str]) -> int:
+        """Release the stores of a batch of deleted lectures, counting references once"""
+        paths = {self._resolve(p) for p in vector_store_paths if p}
+        paths = {p for p in paths if p.is_dir()}
+        if not paths:
+            return 0
+        counts = self.reference_counts()
+        reclaimed = 0
+        for path in paths:
+            if counts[path] == 0:
+                reclaimed += self._dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+        return reclaimed
+
+    def collect_garbage(self) -> Dict:
+        """
+        Remove every store directory no lecture references. Directories
+        modified within STORE_GC_GRACE_SECONDS are kept: an upload or import
+        writes its store before the lecture record that points to it.
+        """
+        if not self.root.exists():
+            return {"removed": [], "bytes_reclaimed": 0}
+        counts = self.reference_counts()
+        removed, reclaimed = [], 0
+        for path in sorted(self.root.iterdir()):
+            if path.is_dir() and counts[path.resolve()] == 0 and not self._recently_modified(path):
+                reclaimed += self._dir_size(path)
+                shutil.rmtree(path, ignore_errors=True)
+                removed.append(path.name)
+        return {"removed": removed, "bytes_reclaimed": reclaimed}
+
+    def merge_duplicates(self) -> Dict:
+        """
+        Point lectures whose stores hold identical content at a single
+        canonical store, then delete the redundant copies. Lectures are
+        repointed by id, and a copy is only deleted once no lecture resolves
+        to it any more.
+        """
+        refs = self.references()
+        groups: Dict[str, List[Path]] = {}
+        for path in refs:
+            if path.is_dir():
+                groups.setdefault(self._fingerprint(path), []).append(path)
+
+        merged, reclaimed = [], 0
+        for paths in groups.values():
+            if len(paths) < 2:
+                continue
+            # Keep the most referenced copy so the fewest records change
+            canonical, *duplicates = sorted(paths, key=lambda p: (-len(refs[p]), str(p)))
+            canonical_ref = os.path.relpath(canonical, PROJECT_ROOT)
+            for duplicate in duplicates:
+                self.lecture_db.set_vector_store_path(refs[duplicate], canonical_ref)
+            remaining = self.references()
+            for duplicate in duplicates:
+                if remaining.get(duplicate):
+                    print(f"Keeping vector store {duplicate.name}: still referenced")
+                    continue
+                reclaimed += self._dir_size(duplicate)
+                shutil.rmtree(duplicate, ignore_errors=True)
+                merged.append((duplicate.name, canonical.name))
+        return {"merged": merged, "bytes_reclaimed": reclaimed}
+
+    def compact(self) -> Dict:
+        """Merge duplicate stores, then collect orphans. Reports the disk recovered."""
+        merge_report = self.merge_duplicates()
+        gc_report = self.collect_garbage()
+        return {
+            "merged": merge_report["merged"],
+            "removed": gc_report["removed"],
+            "bytes_reclaimed": merge_report["bytes_reclaimed"] + gc_report["bytes_reclaimed"]
+        }